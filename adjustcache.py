@@ -0,0 +1,47 @@
+import os
+import re
+
+import numpy as np
+
+from touchstone import list_s2p_dir, load_s2p_dir
+
+cache_dir = './cache'
+
+
+def cache_path(path):
+    name = re.sub(r'[^\w+-]+', '_', os.path.normpath(path)).strip('_')
+    return os.path.join(cache_dir, f'{name}.npz')
+
+
+def signature(files):
+    sig = []
+    for _, file in files:
+        st = os.stat(file)
+        sig.append(f'{os.path.basename(file)}:{st.st_mtime_ns}:{st.st_size}')
+    return np.array(sig, dtype=str)
+
+
+def load_adjust_set(path):
+    files = list_s2p_dir(path)
+    sig = signature(files)
+    cache = cache_path(path)
+
+    if os.path.isfile(cache):
+        try:
+            with np.load(cache) as f:
+                if np.array_equal(f['signature'], sig):
+                    return f['volts'].tolist(), f['freqs'], f['mags'], f['phases']
+        except (OSError, KeyError, ValueError) as ex:
+            print(f'ignoring broken adjust cache {cache}: {ex}')
+
+    volts, freqs, mags, phases = load_s2p_dir(path)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f'{cache}.tmp.npz'
+        np.savez(tmp, signature=sig, volts=np.array(volts), freqs=freqs, mags=mags, phases=phases)
+        os.replace(tmp, cache)
+    except OSError as ex:
+        print(f'could not write adjust cache {cache}: {ex}')
+
+    return volts, freqs, mags, phases
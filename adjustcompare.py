@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from adjustcache import signature
+from measureresult import VectorMeasureResult
+from touchstone import list_s2p_dir
+
+
+def process_adjust_set(path, secondary):
+    # runs in a worker process, the parsed set comes from the adjust cache when it is fresh
+    result = VectorMeasureResult()
+    result._init()
+    result._secondaryParams = dict(secondary)
+    result._adjust_dir = path
+    result._load_ideal()
+    return result
+
+
+def calc_drift(ref, other):
+    # states are matched by control voltage, other temperatures are interpolated onto the reference grid
+    volts = np.round(ref._volts, 3)
+    index = {v: i for i, v in enumerate(np.round(other._volts, 3))}
+    pairs = [(i, index[v]) for i, v in enumerate(volts) if v in index]
+    if not pairs:
+        raise ValueError('adjust sets have no common control voltages')
+    ref_rows, other_rows = map(list, zip(*pairs))
+
+    freqs = np.asarray(ref.freqs)
+
+    def on_ref_grid(rows):
+        return np.array([np.interp(freqs, other.freqs, row) for row in rows])
+
+    ds21 = on_ref_grid(other.s21[other_rows]) - ref.s21[ref_rows]
+    dphase = on_ref_grid(other.phase[other_rows]) - ref.phase[ref_rows]
+    # the sets are unwrapped separately and may start a turn apart, wrap to (-180, 180]
+    dphase = -((180 - dphase) % 360 - 180)
+    return {
+        'freqs': freqs,
+        'volts': volts[ref_rows],
+        'ds21': ds21.mean(axis=0),
+        'ds21_max': np.abs(ds21).max(axis=0),
+        'dphase': dphase.mean(axis=0),
+        'dphase_max': np.abs(dphase).max(axis=0),
+    }
+
+
+class AdjustComparison:
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self.results = dict()
+        self.drifts = dict()
+        self._cache = dict()
+
+    def _key(self, path, secondary):
+        return path, tuple(signature(list_s2p_dir(path))), tuple(sorted(secondary.items()))
+
+    def run(self, paths, secondary, token=None, progress=None):
+        keys = {path: self._key(path, secondary) for path in paths}
+        todo = [path for path in paths if keys[path] not in self._cache]
+        print(f'comparing adjust sets {paths}, {len(paths) - len(todo)} cached')
+
+        if progress:
+            progress(len(paths) - len(todo), len(paths))
+        if todo:
+            with ProcessPoolExecutor(max_workers=self.workers or min(len(todo), os.cpu_count() or 1)) as pool:
+                futures = {pool.submit(process_adjust_set, path, secondary): path for path in todo}
+                for done, future in enumerate(as_completed(futures), start=len(paths) - len(todo) + 1):
+                    if token and token.cancelled:
+                        for f in futures:
+                            f.cancel()
+                        return self
+                    self._cache[keys[futures[future]]] = future.result()
+                    if progress:
+                        progress(done, len(paths))
+
+        self.results = {path: self._cache[keys[path]] for path in paths}
+        ref, *others = paths
+        self.drifts = {path: calc_drift(self.results[ref], self.results[path]) for path in others}
+        return self
+
+    @property
+    def stats(self):
+        if not self.results:
+            return ''
+        ref_path, *_ = self.results
+        ref = self.results[ref_path]
+        cols = [ref._min_freq_index, ref._mid_freq_index, ref._max_freq_index]
+
+        text = ''
+        for path, result in self.results.items():
+            text += f'=== {path} ===\n{result.stats}'
+
+        for path, drift in self.drifts.items():
+            text += f'=== Дрейф {path} относительно {ref_path} ===\n'
+            for col in cols:
+                text += (f'{drift["freqs"][col] / 1_000_000_000:.02f} ГГц: '
+                         f'ΔS21 {drift["ds21"][col]:.02f} (макс {drift["ds21_max"][col]:.02f}) дБ, '
+                         f'Δφ {drift["dphase"][col]:.02f} (макс {drift["dphase_max"][col]:.02f}) град\n')
+            text += '---\n'
+        return text
@@ -0,0 +1,224 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from instrumentcontroller import InstrumentController, parse_float_list
+from measureresult import MeasureResult, VectorMeasureResult
+from mockinstr import SimAnalyzer, SimSource
+from scpiblock import make_binary_block, parse_binary_block
+from settle import settle_policies
+
+backends = {
+    'list': MeasureResult,
+    'vector': VectorMeasureResult,
+}
+
+calc_steps = [
+    '_calc_vwsr_in',
+    '_calc_vwsr_out',
+    '_calc_phase_err',
+    '_calc_s21_err',
+    '_calc_phase_v',
+    '_calc_stats',
+    '_cal_s21_worst_loss',
+]
+
+secondary = {
+    'Pin': -10,
+    'F1': 4,
+    'F2': 8,
+    'U1': 0,
+    'U2': 10,
+    'Ustep': 0.1,
+    'kp': -6,
+    'Fborder1': 4.5,
+    'Fborder2': 7.5,
+}
+
+
+def synth_sweep(points, states, seed=0):
+    rng = np.random.default_rng(seed)
+    freqs = np.linspace(secondary['F1'], secondary['F2'], points) * 1_000_000_000
+    volts = np.round(np.linspace(secondary['U1'], secondary['U2'], states), 2)
+    out = np.zeros((states, 9, points))
+    for i, volt in enumerate(volts):
+        out[i, 0] = freqs
+        out[i, 1] = -18 + rng.normal(0, 1.5, points)
+        out[i, 3] = -4 - 3 * np.sin(freqs / 1e9) - 0.2 * volt + rng.normal(0, 0.2, points)
+        out[i, 4] = (-freqs / 1e7 - 25 * volt + rng.normal(0, 1, points) + 180) % 360 - 180
+        out[i, 7] = -16 + rng.normal(0, 1.5, points)
+    return out.reshape(states, 9 * points), volts.tolist()
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_parse(s2p, repeat):
+    ascii_payload = [','.join(repr(float(x)) for x in pars) for pars in s2p]
+    binary_payload = [make_binary_block(pars, 'REAL,64') for pars in s2p]
+    return {
+        'parse_float_list': timed(lambda: [parse_float_list(p) for p in ascii_payload], repeat),
+        'parse_binary_block': timed(lambda: [parse_binary_block(p, 'REAL,64') for p in binary_payload], repeat),
+    }
+
+
+def bench_result(cls, points, s2p, volts, repeat):
+    payload = [list(pars) for pars in s2p] if cls is MeasureResult else s2p
+    result = cls()
+
+    def set_raw():
+        result.raw_data = points, payload, volts, secondary
+
+    timings = {'raw_data': timed(set_raw, repeat)}
+    # steps are rerun on the processed result, each of them is idempotent
+    for step in calc_steps:
+        timings[step] = timed(getattr(result, step), repeat)
+    timings['stats'] = timed(lambda: result.stats, repeat)
+    return result, timings
+
+
+def bench_plot(result, repeat, img_path):
+    from PyQt5.QtWidgets import QApplication
+    from primaryplotwidget import PrimaryPlotWidget
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    widget = PrimaryPlotWidget(parent=None, result=result)
+    timings = {
+        'plot': timed(widget.plot, repeat),
+    }
+    # save only snapshots and submits, the files are written by the worker processes
+    start = time.perf_counter()
+    futures = widget.save(img_path)
+    timings['save'] = time.perf_counter() - start
+    for future in futures:
+        future.result()
+    timings['export'] = time.perf_counter() - start
+    widget._exporter.shutdown()
+    widget.deleteLater()
+    app.processEvents()
+    return timings
+
+
+def bench_controller(points, states, settle, transfer_format, archive_mode):
+    src = SimSource()
+    pna = SimAnalyzer(source=src)
+    controller = InstrumentController()
+    controller.attach({'Анализатор': pna, 'Источник': src})
+    controller.sweep_points = points
+    controller.secondaryParams = dict(secondary, U1=0, U2=round((states - 1) * 0.1, 1), Ustep=0.1)
+    controller.settle = {p.label: p for p in settle_policies}[settle]()
+    controller.transfer_formats['Анализатор'] = transfer_format
+    controller.archive.mode = archive_mode
+
+    start = time.perf_counter()
+    controller.measure([next(iter(controller.deviceParams)), controller.secondaryParams])
+    return {
+        'measure': time.perf_counter() - start,
+        'hardware_sweep': states * pna.sweep_time,
+        'settle': controller.settle.summary,
+    }
+
+
+def run_sim(points_list, states, settle, transfer_format, archive_mode):
+    runs = []
+    for points in points_list:
+        print(f'simulated sweep: {states} states x {points} points, {settle} settle, {transfer_format}')
+        runs.append({
+            'points': points,
+            'states': states,
+            'settle': settle,
+            'format': transfer_format,
+            'archive': archive_mode,
+            'timings': bench_controller(points, states, settle, transfer_format, archive_mode),
+        })
+    return runs
+
+
+def run(points_list, states_list, backend_names, repeat, plot, img_path):
+    runs = []
+    for points in points_list:
+        for states in states_list:
+            s2p, volts = synth_sweep(points, states)
+            row = {
+                'points': points,
+                'states': states,
+                'timings': bench_parse(s2p, repeat),
+            }
+            for name in backend_names:
+                print(f'benchmarking {name} backend: {states} states x {points} points')
+                result, timings = bench_result(backends[name], points, s2p, volts, repeat)
+                if plot:
+                    timings.update(bench_plot(result, repeat, img_path))
+                row['timings'].update({f'{name}.{k}': v for k, v in timings.items()})
+            runs.append(row)
+    return runs
+
+
+def compare(old, new):
+    old_runs = {(r['points'], r['states']): r['timings'] for r in old['runs']}
+    for run in new['runs']:
+        key = (run['points'], run['states'])
+        if key not in old_runs:
+            continue
+        for name, value in run['timings'].items():
+            before = old_runs[key].get(name)
+            if before:
+                print(f'{key[1]:>4} x {key[0]:>5} {name:<32} {before * 1000:10.3f} ms -> {value * 1000:10.3f} ms  x{before / value:.2f}')
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Measurement pipeline benchmark')
+    parser.add_argument('--points', type=int, nargs='+', default=[81, 801, 1601, 16001])
+    parser.add_argument('--states', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--backend', choices=list(backends), nargs='+', default=list(backends))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--plot', action='store_true', help='also time PrimaryPlotWidget.plot and save offscreen')
+    parser.add_argument('--img-path', default='./bench_image/')
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--compare', help='previous benchmark json to compare against')
+    parser.add_argument('--sim', action='store_true', help='also run InstrumentController end to end on the simulated PNA')
+    parser.add_argument('--sim-states', type=int, default=21)
+    parser.add_argument('--sim-settle', choices=[p.label for p in settle_policies], default='sweep')
+    parser.add_argument('--sim-format', choices=['ASCII', 'REAL,32', 'REAL,64'], default='REAL,64')
+    parser.add_argument('--sim-archive', choices=['off', 'instrument', 'host', 'host_batch'], default='instrument')
+    opts = parser.parse_args(args)
+
+    if opts.plot:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeat': opts.repeat,
+        },
+        'runs': run(opts.points, opts.states, opts.backend, opts.repeat, opts.plot, opts.img_path),
+    }
+    if opts.sim:
+        report['sim'] = run_sim(opts.points, opts.sim_states, opts.sim_settle, opts.sim_format, opts.sim_archive)
+
+    with open(opts.out, mode='wt', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'written {opts.out}')
+
+    if opts.compare:
+        with open(opts.compare, mode='rt', encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -37,6 +37,8 @@ class ConnectionWidget(QWidget):
 
         self._setupUi()
 
+        self._controller.instrumentFound.connect(self.on_instrumentFound)
+
     def _setupUi(self):
         for i, iw in enumerate(self._widgets.items()):
             self._ui.layInstruments.insertWidget(i, iw[1])
@@ -49,6 +51,10 @@ class ConnectionWidget(QWidget):
                                         self.connectTaskComplete,
                                         {k: w.address for k, w in self._widgets.items()}))
 
+    @pyqtSlot(str, str)
+    def on_instrumentFound(self, name, status):
+        self._widgets[name].status = status
+
     def connectTaskComplete(self):
         if not self._controller.found:
             print('connect error, check connection')
@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+
+
+class FreqAxis:
+    # nearest point lookups on a sweep grid in Hz: direct on a uniform grid, bisection otherwise
+    def __init__(self, freqs):
+        self.freqs = np.asarray(freqs, dtype=float)
+        self._memo = dict()
+
+        n = len(self.freqs)
+        steps = np.diff(self.freqs)
+        self.sorted = bool(np.all(steps >= 0))
+        self._start = self.freqs[0] if n else 0.0
+        self._step = (self.freqs[-1] - self.freqs[0]) / (n - 1) if n > 1 else 0.0
+        self.uniform = n > 1 and self._step > 0 and bool(np.allclose(steps, self._step, rtol=1e-6, atol=0))
+
+    def __len__(self):
+        return len(self.freqs)
+
+    def _guess(self, freq):
+        if self.uniform:
+            return math.floor((freq - self._start) / self._step)
+        return int(np.searchsorted(self.freqs, freq)) - 1
+
+    def index(self, freq):
+        try:
+            return self._memo[freq]
+        except KeyError:
+            pass
+
+        n = len(self.freqs)
+        if not n:
+            raise ValueError('empty frequency axis')
+        if self.sorted:
+            # the guess may be one point off, the first of the nearest points wins as in a linear scan
+            guess = self._guess(freq)
+            candidates = range(min(max(guess - 1, 0), n - 1), min(max(guess + 3, 1), n))
+            index = min(candidates, key=lambda i: abs(self.freqs[i] - freq))
+        else:
+            index = int(np.argmin(np.abs(self.freqs - freq)))
+
+        self._memo[freq] = index
+        return index
+
+    def index_ghz(self, freq):
+        return self.index(freq * 1_000_000_000)
+
+    def span(self, f1, f2):
+        # index range covering [f1, f2] with one point past each edge
+        n = len(self.freqs)
+        if not self.sorted:
+            return 0, n
+        i0 = self._guess(f1)
+        i1 = self._guess(f2) + 3
+        return min(max(i0, 0), n), min(max(i1, 0), n)
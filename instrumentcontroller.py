@@ -1,14 +1,33 @@
+import json
+import os
+import re
 import time
+
 import numpy as np
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from os.path import isfile
-from PyQt5.QtCore import QObject, pyqtSlot
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 
 from instr.instrumentfactory import NetworkAnalyzerFactory, SourceFactory, mock_enabled
-from measureresult import MeasureResult
+from measureresult import VectorMeasureResult
+from mockinstr import MockAnalyzer, MockSource
+from profiler import Profiler, ProfiledInstrument
+from s2parchive import S2pArchive, s2p_name
+from scpiblock import parse_binary_block
+from settle import FixedSettle
+from session import Session, save_session
+from sweeppipeline import SweepPipeline
+from sweepplan import fastcheck_plan, linear_plan, plan_points, segmented_plan, stat_freqs
+from touchstone import write_s2p
 
 
 class InstrumentController(QObject):
+
+    stateMeasured = pyqtSignal(int)
+    instrumentFound = pyqtSignal(str, str)
+    deviceStarted = pyqtSignal(str)
+    deviceMeasured = pyqtSignal(str)
     phases = [
         22.5,
         45.0,
@@ -45,6 +64,24 @@ class InstrumentController(QObject):
                 raw = ''.join(f.readlines())
                 self.deviceParams = ast.literal_eval(raw)
 
+        # last known-good addresses and IDNs, a reconnect to the same address reuses the instrument
+        self.find_timeouts = {
+            'Анализатор': 10,
+            'Источник': 10,
+        }
+        self._known = dict()
+        if isfile('./instruments.json'):
+            try:
+                with open('./instruments.json', 'rt', encoding='utf-8') as f:
+                    known = {k: v for k, v in json.load(f).items() if k in self.requiredInstruments}
+                addrs = {k: v['addr'] for k, v in known.items()}
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as ex:
+                print(f'ignoring broken instrument cache: {ex!r}')
+            else:
+                self._known = known
+                for k, addr in addrs.items():
+                    self.requiredInstruments[k].addr = addr
+
         self.secondaryParams = {
             'Pin': -10,
             'F1': 4,
@@ -61,12 +98,40 @@ class InstrumentController(QObject):
         self.sweep_points = 81
         self.cal_set = 'Upr_tst'
 
+        # linear, segmented or fastcheck, see sweepplan.py
+        self.sweep_mode = 'linear'
+        self.segment_span = 0.25
+        self.segment_dense_step = 0.01
+        self.segment_sparse_step = 0.25
+        self._plan = list()
+        self._plan_points = self.sweep_points
+
+        # ASCII, REAL,32 or REAL,64; instruments without raw reads fall back to ASCII
+        self.transfer_formats = {
+            'Анализатор': 'REAL,64',
+        }
+        self._formats = dict()
+
+        # last configuration sent to the analyzer, command key -> command(s)
+        self.force_reinit = False
+        self._applied = dict()
+
+        self.settle = FixedSettle()
+        # states buffered between acquisition and parsing, 0 parses inline
+        self.pipeline_depth = 4
+
+        self.archive = S2pArchive(mode='instrument')
+
+        self.profiler = Profiler()
+        self.profile_path = ''
+
         self._instruments = dict()
         self.found = False
         self.present = False
         self.hasResult = False
+        self.cancelled = False
 
-        self.result = MeasureResult()
+        self.result = VectorMeasureResult()
 
         self._freqs = list()
         self._mag_s11s = list()
@@ -83,13 +148,104 @@ class InstrumentController(QObject):
         for k, v in addrs.items():
             self.requiredInstruments[k].addr = v
         self.found = self._find()
+        self._applied.clear()
+
+    def attach(self, instruments):
+        self._instruments = self._profiled(instruments)
+        self._applied.clear()
+        self.found = all(self._instruments.values())
 
     def _find(self):
-        self._instruments = {
-            k: v.find() for k, v in self.requiredInstruments.items()
-        }
+        if mock_enabled:
+            src = MockSource()
+            self._instruments = self._profiled({
+                'Анализатор': MockAnalyzer(source=src),
+                'Источник': src,
+            })
+            return True
+
+        found = dict()
+        to_probe = dict()
+        for name, factory in self.requiredInstruments.items():
+            instrument = self._reuse(name, factory.addr)
+            if instrument:
+                found[name] = instrument
+                self.instrumentFound.emit(name, instrument.status)
+            else:
+                to_probe[name] = factory
+
+        found.update(self._probe_all(to_probe))
+        self._instruments = found
+        self._remember()
         return all(self._instruments.values())
 
+    def _reuse(self, name, addr):
+        known = self._known.get(name)
+        instrument = self._instruments.get(name)
+        if not known or not instrument or known['addr'] != addr:
+            return None
+        try:
+            idn = instrument.query('*IDN?').strip()
+        except Exception as ex:
+            print(f'{name} at {addr} stopped answering: {ex}')
+            return None
+        return instrument if idn == known['idn'] else None
+
+    def _probe_all(self, factories):
+        if not factories:
+            return dict()
+
+        found = {name: None for name in factories}
+        pool = ThreadPoolExecutor(max_workers=len(factories), thread_name_prefix='find')
+        start = time.perf_counter()
+        pending = {pool.submit(factory.find): name for name, factory in factories.items()}
+        deadlines = {name: start + self.find_timeouts.get(name, 10) for name in factories}
+
+        while pending:
+            now = time.perf_counter()
+            timeout = max(min(deadlines[name] for name in pending.values()) - now, 0)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    instrument = future.result()
+                except Exception as ex:
+                    print(f'error probing {name}: {ex}')
+                    instrument = None
+                found[name] = self._profiled({name: instrument})[name]
+                self.instrumentFound.emit(name, instrument.status if instrument else 'не найден')
+
+            now = time.perf_counter()
+            for future, name in list(pending.items()):
+                if now >= deadlines[name]:
+                    # the probe thread is abandoned, it cannot be interrupted
+                    del pending[future]
+                    print(f'{name} did not answer in {self.find_timeouts.get(name, 10)} s')
+                    self.instrumentFound.emit(name, 'нет ответа')
+
+        pool.shutdown(wait=False)
+        return found
+
+    def _remember(self):
+        for name, instrument in self._instruments.items():
+            if not instrument:
+                continue
+            try:
+                idn = instrument.query('*IDN?').strip()
+            except Exception:
+                continue
+            self._known[name] = {'addr': self.requiredInstruments[name].addr, 'idn': idn}
+        try:
+            # a crash mid-write must not leave a truncated cache behind
+            with open('./instruments.json.tmp', 'wt', encoding='utf-8') as f:
+                json.dump(self._known, f, indent=2, ensure_ascii=False)
+            os.replace('./instruments.json.tmp', './instruments.json')
+        except OSError as ex:
+            print(f'could not save instrument cache: {ex}')
+
+    def _profiled(self, instruments):
+        return {k: ProfiledInstrument(v, self.profiler, k) if v else v for k, v in instruments.items()}
+
     def check(self, params):
         print(f'call check with {params}')
         device, secondary = params
@@ -104,63 +260,227 @@ class InstrumentController(QObject):
         print(f'run check with {param}, {secondary}')
         return True
 
-    def measure(self, params):
+    def measure(self, params, token=None, progress=None):
         print(f'call measure with {params}')
         device, secondary = params
-        self.result.raw_data = self.sweep_points, self._measure(device, secondary), self._phase_values, self.secondaryParams
+        self.hasResult = False
+        self._measure(device, secondary, token, progress)
+        self.cancelled = bool(token and token.cancelled)
+        print('process result')
+        with self.profiler.span('finish'):
+            self.result.finish()
         self.hasResult = bool(self.result)
 
-    def _measure(self, device, secondary):
+    def _measure(self, device, secondary, token=None, progress=None):
         param = self.deviceParams[device]
         secondary = self.secondaryParams
         print(f'launch measure with {param} {secondary}')
 
         self._clear()
-        self._init(secondary)
-
-        res = self._measure_s_params(param, secondary)
+        try:
+            with self.profiler.span('init'):
+                self._init(secondary)
+
+            with self.profiler.span('sweep'):
+                res = self._measure_s_params(param, secondary, token, progress)
+            print(f'settle timing: {self.settle.summary}')
+        finally:
+            # leave the source safe whatever happened during the sweep
+            self._source_off(self._instruments['Источник'])
+
+        if self.profile_path:
+            self.profiler.export(self.profile_path)
+        return res
 
+    def measure_batch(self, devices, wait_next=None, on_measured=None, path='./batch', token=None, progress=None):
+        # devices: [(serial, device type)], wait_next(serial, device) -> bool blocks until the next device is in place,
+        # on_measured(serial) blocks until the result is shown, the next device reuses the same result object
+        print(f'call batch measure with {devices}')
+        secondary = self.secondaryParams
         src = self._instruments['Источник']
+        measured = []
+
+        self._clear()
+        try:
+            with self.profiler.span('init'):
+                self._init(secondary)
+            self._source_off(src)
+
+            for i, (serial, device) in enumerate(devices):
+                if token and token.cancelled:
+                    print(f'batch cancelled after {i} of {len(devices)} devices')
+                    break
+                if wait_next and not wait_next(serial, device):
+                    print(f'skipping {serial}')
+                    continue
+
+                self.deviceStarted.emit(serial)
+                self._phase_values.clear()
+                self._source_on(src)
+                try:
+                    with self.profiler.span('sweep'):
+                        self._measure_s_params(self.deviceParams[device], secondary, token)
+                finally:
+                    self._source_off(src)
+
+                if token and token.cancelled:
+                    print(f'batch cancelled while measuring {serial}, result is not saved')
+                    break
+
+                with self.profiler.span('finish'):
+                    self.result.finish()
+                if self.result:
+                    self._save_result(path, serial)
+                    measured.append(serial)
+                    self.deviceMeasured.emit(serial)
+                    if on_measured:
+                        on_measured(serial)
+                if progress:
+                    progress(i + 1, len(devices))
+        finally:
+            self._source_off(src)
+
+        self.cancelled = bool(token and token.cancelled)
+        self.hasResult = bool(self.result)
+        if self.profile_path:
+            self.profiler.export(self.profile_path)
+        return measured
+
+    def _save_result(self, path, serial):
+        dev_path = os.path.join(path, re.sub(r'[^\w.+-]+', '_', serial))
+        os.makedirs(dev_path, exist_ok=True)
+        with open(os.path.join(dev_path, 'stats.txt'), mode='wt', encoding='utf-8') as f:
+            f.write(self.result.stats)
+        for volt, pars in zip(self.result._volts, self.result.raw):
+            write_s2p(os.path.join(dev_path, s2p_name(volt)), pars, comment=f'{serial} U={volt} V')
+        self.save_session(os.path.join(dev_path, 'session.npz'), serial=serial)
+
+    def save_session(self, path, **meta):
+        save_session(path, self.result, meta={
+            'cal_set': self.cal_set,
+            'sweep_mode': self.sweep_mode,
+            'timing': {
+                'settle': self.settle.summary,
+                'profile': self.profiler.summary,
+            },
+            **meta,
+        })
+
+    def load_session(self, path, reprocess=False):
+        with Session(path) as session:
+            session.load(self.result, reprocess=reprocess)
+        self.hasResult = bool(self.result)
+
+    def _source_on(self, src):
+        src.set_current(chan=1, value=10, unit='mA')
+        src.set_voltage(chan=1, value=0, unit='V')
+        src.set_output(chan=1, state='ON')
+
+    def _source_off(self, src):
         src.set_current(chan=1, value=0, unit='mA')
         src.set_voltage(chan=1, value=0, unit='V')
         src.set_output(chan=1, state='OFF')
 
-        return res
-
     def _clear(self):
         self._phase_values.clear()
+        self.profiler.clear()
 
     def _init(self, params):
         pna = self._instruments['Анализатор']
         src = self._instruments['Источник']
 
-        pna.send('SYST:PRES')
-        pna.query('*OPC?')
-        # pna.send('SENS1:CORR ON')
-
-        pna.send('CALC1:PAR:DEF "CH1_S21",S21')
-
+        self._plan = self._sweep_plan(params)
+        self._plan_points = plan_points(self._plan)
+        self._formats['Анализатор'] = self._transfer_format('Анализатор')
+
+        if self.force_reinit or not self._applied:
+            self._applied.clear()
+            with self.profiler.span('init.preset'):
+                pna.send('SYST:PRES')
+                pna.query('*OPC?')
+            # pna.send('SENS1:CORR ON')
+
+            pna.send('CALC1:PAR:DEF "CH1_S21",S21')
+
+        try:
+            with self.profiler.span('init.config'):
+                self._apply_config(pna, self._config_commands(self._plan, self._formats['Анализатор']))
+        except Exception:
+            # analyzer state is unknown now, next init starts from preset
+            self._applied.clear()
+            raise
+
+        self.settle.prepare(pna, src)
+
+        with self.profiler.span('init.source'):
+            self._source_on(src)
+
+    def _sweep_plan(self, params):
+        mode = self.sweep_mode
+        if mock_enabled and mode != 'linear':
+            print(f'{mode} sweep is not available with replayed mock data, using linear')
+            mode = 'linear'
+
+        self.result.sparse = mode == 'fastcheck'
+        if mode == 'fastcheck':
+            return fastcheck_plan(stat_freqs(params))
+        if mode == 'segmented':
+            centers = stat_freqs(params)
+            # dense around the last known Kp band edges as well
+            centers += [f for f in (self.result._kp_freq_min, self.result._kp_freq_max) if f not in ('n/a', 0)]
+            return segmented_plan(params['F1'], params['F2'], centers, span=self.segment_span,
+                                  dense_step=self.segment_dense_step, sparse_step=self.segment_sparse_step)
+        return linear_plan(params['F1'], params['F2'], self.sweep_points)
+
+    def _config_commands(self, plan, fmt):
         # c:\program files\agilent\newtowrk analyzer\UserCalSets
-        pna.send(f'SENS1:CORR:CSET:ACT "{self.cal_set}",1')
-        # pna.send('SENS2:CORR:CSET:ACT "-20dBm_1.1-1.4G",1')
-
-        pna.send(f'SENS1:SWE:POIN {self.sweep_points}')
-
-        pna.send(f'SENS1:FREQ:STAR {params["F1"]}GHz')
-        pna.send(f'SENS1:FREQ:STOP {params["F2"]}GHz')
-
-        pna.send('SENS1:SWE:MODE CONT')
-        pna.send(f'FORM:DATA ASCII')
-
-        src.set_current(chan=1, value=10, unit='mA')
-        src.set_voltage(chan=1, value=0, unit='V')
-        src.set_output(chan=1, state='ON')
-
-    def _measure_s_params(self, param, secondary):
+        commands = [('CSET', f'SENS1:CORR:CSET:ACT "{self.cal_set}",1')]
+        # commands.append(('CSET2', 'SENS2:CORR:CSET:ACT "-20dBm_1.1-1.4G",1'))
+
+        if self.sweep_mode == 'linear' or mock_enabled:
+            f1, f2, points = plan[0]
+            commands += [
+                ('SWE:TYPE', 'SENS1:SWE:TYPE LIN'),
+                ('SWE:POIN', f'SENS1:SWE:POIN {points}'),
+                ('FREQ:STAR', f'SENS1:FREQ:STAR {f1}GHz'),
+                ('FREQ:STOP', f'SENS1:FREQ:STOP {f2}GHz'),
+            ]
+        else:
+            segments = ['SENS1:SEGM:DEL:ALL']
+            for i, (f1, f2, points) in enumerate(plan, start=1):
+                segments += [
+                    f'SENS1:SEGM{i}:ADD',
+                    f'SENS1:SEGM{i}:FREQ:STAR {f1}GHz',
+                    f'SENS1:SEGM{i}:FREQ:STOP {f2}GHz',
+                    f'SENS1:SEGM{i}:SWE:POIN {points}',
+                    f'SENS1:SEGM{i} ON',
+                ]
+            commands += [
+                ('SEGM', tuple(segments)),
+                ('SWE:TYPE', 'SENS1:SWE:TYPE SEGM'),
+            ]
+
+        commands.append(('FORM:DATA', f'FORM:DATA {fmt}'))
+        if fmt != 'ASCII':
+            commands.append(('FORM:BORD', 'FORM:BORD NORM'))
+        return commands
+
+    def _apply_config(self, pna, commands):
+        for key, command in commands:
+            if self._applied.get(key) == command:
+                continue
+            for c in (command if isinstance(command, tuple) else (command, )):
+                pna.send(c)
+            self._applied[key] = command
+            if key == 'CSET':
+                # activating a cal set also applies its stimulus, the sweep has to be sent again
+                for stimulus in ('SWE:TYPE', 'SWE:POIN', 'FREQ:STAR', 'FREQ:STOP', 'SEGM'):
+                    self._applied.pop(stimulus, None)
+
+    def _measure_s_params(self, param, secondary, token=None, progress=None):
         pna = self._instruments['Анализатор']
         src = self._instruments['Источник']
 
-        out = []
         u1 = secondary['U1']
         u2 = secondary['U2']
         ustep = secondary['Ustep']
@@ -171,29 +491,71 @@ class InstrumentController(QObject):
                       2.25, 2.5, 2.75, 2, 3.25, 3.5, 3.75, 3, 4.25, 4.5, 4.75, 4, 5.25, 5.5, 5.75, 5, 6.25, 6.5, 6.75,
                       6, 7.25, 7.5, 7.75, 7, 8.25, 8.5, 8.75, 8, 9.25, 9.5, 9.75, 9]
 
-        for ucontrol in values:
-            self._phase_values.append(ucontrol)
-
+        self.result.begin(self._plan_points, values, secondary)
+        self.archive.begin()
+        try:
+            with SweepPipeline(self._process_state, depth=self.pipeline_depth) as pipeline:
+                for i, ucontrol in enumerate(values):
+                    if token and token.cancelled:
+                        print(f'measure cancelled after {i} of {len(values)} states')
+                        break
+                    self._acquire_state(pna, src, ucontrol, pipeline)
+                    if progress:
+                        progress(i + 1, len(values))
+        finally:
+            self.archive.finish()
+        return pipeline.processed
+
+    def _acquire_state(self, pna, src, ucontrol, pipeline):
+        self._phase_values.append(ucontrol)
+
+        with self.profiler.span('step.set_voltage'):
             src.set_voltage(chan=1, value=ucontrol, unit='V')
-            if not mock_enabled:
-                time.sleep(0.5)
+        if not mock_enabled:
+            with self.profiler.span('step.settle'):
+                self.settle.settle(pna, src, ucontrol)
 
+        with self.profiler.span('step.opc'):
             pna.send(f'CALC1:PAR:SEL "CH1_S21"')
             pna.query('*OPC?')
-            res = pna.query(f'CALC1:DATA:SNP? 2')
-
-            pna.send(f'CALC:DATA:SNP:PORTs:Save "1,2", "d:/ksa/psm_analog_s2p/s{str(f"{ucontrol:.01f}").replace(".", "_")}.s2p"')
-            pna.send(f'MMEM:STOR "d:/ksa/psm_analog_ports2/s{str(f"{ucontrol:.01f}").replace(".", "_")}.s2p"')
-
-            if mock_enabled:
-                fn = f'ref/sample_data/out_s{ucontrol:05.2f}.s2p'
-                with open(fn, mode='rt', encoding='utf-8') as f:
-                    res = list(f.readlines())[0].strip()
-            out.append(parse_float_list(res))
-
-            if not mock_enabled:
-                time.sleep(0.5)
-        return out
+        with self.profiler.span('step.transfer'):
+            raw = self._read_snp(pna)
+        with self.profiler.span('step.queue'):
+            pipeline.put((ucontrol, raw))
+
+        with self.profiler.span('step.save'):
+            self.archive.save_remote(pna, ucontrol)
+
+        if not mock_enabled:
+            with self.profiler.span('step.release'):
+                self.settle.release(pna, src, ucontrol)
+
+    def _process_state(self, item):
+        ucontrol, raw = item
+        with self.profiler.span('step.parse'):
+            pars = self._parse_snp(raw)
+        self.archive.save_host(ucontrol, pars)
+        with self.profiler.span('step.process'):
+            self.result.append_state(pars)
+        self.stateMeasured.emit(self.result.count - 1)
+
+    def _transfer_format(self, name):
+        fmt = self.transfer_formats.get(name, 'ASCII')
+        if fmt != 'ASCII' and not hasattr(self._instruments[name], 'query_raw'):
+            print(f'{name} does not support raw reads, falling back to ASCII')
+            return 'ASCII'
+        return fmt
+
+    def _read_snp(self, pna):
+        if self._formats.get('Анализатор', 'ASCII') == 'ASCII':
+            return pna.query('CALC1:DATA:SNP? 2')
+        return pna.query_raw('CALC1:DATA:SNP? 2')
+
+    def _parse_snp(self, raw):
+        fmt = self._formats.get('Анализатор', 'ASCII')
+        if fmt == 'ASCII':
+            return parse_float_list(raw)
+        return parse_binary_block(raw, fmt)
 
     def pow_sweep(self):
         print('pow sweep')
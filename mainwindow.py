@@ -1,14 +1,21 @@
+import re
+
 from PyQt5 import uic
-from PyQt5.QtWidgets import QMainWindow
-from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QModelIndex
+from PyQt5.QtWidgets import QMainWindow, QMessageBox, QFileDialog
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QModelIndex, QThreadPool
 
 from formlayout.formlayout import fedit
+from adjustcompare import AdjustComparison
 from instrumentcontroller import InstrumentController
+from measurejob import GuiCall, MeasureJob, OperatorPrompt
 from connectionwidget import ConnectionWidget
 from measuremodel import MeasureModel
 from measurewidget import MeasureWidgetWithSecondaryParameters
 from powsweepwidget import PowSweepWidget
 from primaryplotwidget import PrimaryPlotWidget
+from s2parchive import S2pArchive
+from settle import settle_policies
+from sweepplan import sweep_modes
 from statwidget import StatWidget
 
 
@@ -42,6 +49,15 @@ class MainWindow(QMainWindow):
         self._ui.tabWidget.insertTab(0, self._plotWidget, 'Автоматическое измерение')
         self._ui.tabWidget.insertTab(1, self._powSweepWidget, 'Прогон по частоте')
 
+        self._showProfile = False
+
+        self._threads = QThreadPool()
+        self._batchJob = None
+        self._prompt = OperatorPrompt(parent=self)
+        self._deviceShown = GuiCall(self.on_deviceMeasured, parent=self)
+        self._comparison = AdjustComparison()
+        self._compareJob = None
+
         self._init()
 
     def _init(self):
@@ -53,6 +69,12 @@ class MainWindow(QMainWindow):
         self._measureWidget.measureStarted.connect(self.on_measureStarted)
         self._measureWidget.measureComplete.connect(self._measureModel.update)
         self._measureWidget.measureComplete.connect(self.on_measureComplete)
+        self._measureWidget.measureAborted.connect(self.on_measureAborted)
+
+        self._instrumentController.stateMeasured.connect(self._plotWidget.on_stateMeasured)
+        self._instrumentController.deviceStarted.connect(self.on_measureStarted)
+        self._plotWidget.saved.connect(self.on_plotsSaved)
+        self._plotWidget.saveFailed.connect(self.on_plotsSaveFailed)
 
         # self._ui.tableMeasure.setModel(self._measureModel)
 
@@ -81,12 +103,30 @@ class MainWindow(QMainWindow):
     def on_measureComplete(self):
         print('meas complete')
         # self._plotWidget.preparePlots(self._instrumentController.secondaryParams)
-        self._plotWidget.plot()
-        self._statWidget.stats = self._instrumentController.result.stats
+        if self._plotWidget.streaming:
+            self._plotWidget.finish_stream()
+        else:
+            self._plotWidget.plot()
+        stats = self._instrumentController.result.stats
+        if self._showProfile:
+            stats += f'---\n{self._instrumentController.profiler.report()}\n'
+        self._statWidget.stats = stats
+        self._ui.actParams.setEnabled(self._batchJob is None)
+
+    @pyqtSlot()
+    def on_measureAborted(self):
+        self._plotWidget.abort_stream()
+        self._statWidget.stats = ''
+        self._ui.actParams.setEnabled(self._batchJob is None)
 
     @pyqtSlot()
     def on_measureStarted(self):
-        self._plotWidget.clear()
+        # the sweep reads its parameters as it goes
+        self._ui.actParams.setEnabled(False)
+        if self._plotWidget.streaming:
+            self._plotWidget.begin_stream()
+        else:
+            self._plotWidget.clear()
 
     @pyqtSlot()
     def on_actParams_triggered(self):
@@ -96,16 +136,195 @@ class MainWindow(QMainWindow):
             ('Калибровка', self._instrumentController.cal_set),
             ('Только основные', only_main_states),
             ('Набор для коррекции', [1, '+25', '+85', '-60']),
+            ('Ожидание установки', [settle_policies.index(type(self._instrumentController.settle)), 'фиксированное', 'по напряжению', 'по развертке']),
+            ('Сохранение s2p', [S2pArchive.modes.index(self._instrumentController.archive.mode), 'нет', 'на анализаторе', 'на ПК', 'на ПК после измерения']),
+            ('Профилирование', self._showProfile),
+            ('Развертка', [sweep_modes.index(self._instrumentController.sweep_mode), 'линейная', 'сегментная', 'быстрая проверка']),
+            ('Полная переинициализация', self._instrumentController.force_reinit),
+            ('Доп. уровни Kp, дБ', ', '.join(str(level) for level in self._instrumentController.result.kp_levels)),
+            ('Интерполяция границ Kp', self._instrumentController.result.kp_interpolate),
         ]
 
         values = fedit(data=data, title='Параметры')
         if not values:
             return
 
-        adjust, cal_set, only_main_states, adjust_set = values
+        adjust, cal_set, only_main_states, adjust_set, settle, archive_mode, show_profile, sweep_mode, force_reinit, \
+            kp_levels, kp_interpolate = values
 
         self._instrumentController.result.adjust = adjust
         self._instrumentController.result.adjust_set = adjust_set
         self._instrumentController.cal_set = cal_set
         self._plotWidget.only_main_states = only_main_states
+        if not isinstance(self._instrumentController.settle, settle_policies[settle]):
+            self._instrumentController.settle = settle_policies[settle]()
+        self._instrumentController.archive.mode = S2pArchive.modes[archive_mode]
+        self._showProfile = show_profile
+        self._instrumentController.sweep_mode = sweep_modes[sweep_mode]
+        self._instrumentController.profile_path = './profile.json' if show_profile else ''
+        self._instrumentController.force_reinit = force_reinit
+        try:
+            self._instrumentController.result.kp_levels = [float(level) for level in re.split(r'[,;\s]+', kp_levels) if level]
+        except ValueError:
+            QMessageBox.warning(self, 'Ошибка', f'Неверный список уровней Kp: {kp_levels}')
+        self._instrumentController.result.kp_interpolate = kp_interpolate
+
+    @pyqtSlot()
+    def on_actSaveSession_triggered(self):
+        if not self._instrumentController.result:
+            QMessageBox.information(self, 'Сессия', 'Нет результата измерения')
+            return
+        path, _ = QFileDialog.getSaveFileName(self, 'Сохранить сессию', '.', 'Сессия (*.npz)')
+        if not path:
+            return
+        if not path.endswith('.npz'):
+            path += '.npz'
+        self._instrumentController.save_session(path)
+
+    @pyqtSlot()
+    def on_actSavePlots_triggered(self):
+        if not self._instrumentController.result:
+            QMessageBox.information(self, 'Графики', 'Нет результата измерения')
+            return
+        path = QFileDialog.getExistingDirectory(self, 'Папка для графиков', '.')
+        if not path:
+            return
+        self._plotWidget.save(path)
+        self._ui.statusbar.showMessage('Сохранение графиков...')
+
+    @pyqtSlot(str, list)
+    def on_plotsSaved(self, path, files):
+        self._ui.statusbar.showMessage(f'Графики сохранены в {path}: {len(files)} файлов')
+
+    @pyqtSlot(str)
+    def on_plotsSaveFailed(self, message):
+        self._ui.statusbar.clearMessage()
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка сохранения графиков: {message}')
+
+    @pyqtSlot()
+    def on_actOpenSession_triggered(self):
+        self._openSession(reprocess=False)
+
+    @pyqtSlot()
+    def on_actReprocessSession_triggered(self):
+        self._openSession(reprocess=True)
+
+    def _openSession(self, reprocess):
+        path, _ = QFileDialog.getOpenFileName(self, 'Открыть сессию', '.', 'Сессия (*.npz)')
+        if not path:
+            return
+        try:
+            self._instrumentController.load_session(path, reprocess=reprocess)
+        except (OSError, KeyError, ValueError) as ex:
+            QMessageBox.warning(self, 'Ошибка', f'Не удалось открыть сессию: {ex}')
+            return
+        self._plotWidget.clear()
+        self._plotWidget.plot()
+        self._statWidget.stats = self._instrumentController.result.stats
+
+    @pyqtSlot()
+    def on_actBatch_triggered(self):
+        if not self._instrumentController.found:
+            QMessageBox.information(self, 'Пакетное измерение', 'Сначала подключите приборы')
+            return
+        if self._batchJob is not None:
+            self._batchJob.cancel()
+            return
+        if self._measureWidget.busy:
+            QMessageBox.information(self, 'Пакетное измерение', 'Дождитесь окончания измерения')
+            return
+
+        devices = list(self._instrumentController.deviceParams.keys())
+        data = [
+            ('Серийные номера', ''),
+            ('Прибор', [0] + devices),
+            ('Ждать оператора', True),
+            ('Папка', './batch'),
+        ]
+
+        values = fedit(data=data, title='Пакетное измерение')
+        if not values:
+            return
+
+        serials, device, wait_operator, path = values
+        serials = [s for s in re.split(r'[,;\s]+', serials) if s]
+        if not serials:
+            return
+
+        self._batchJob = MeasureJob(self._instrumentController.measure_batch,
+                                    [(serial, devices[device]) for serial in serials],
+                                    wait_next=self._prompt if wait_operator else None,
+                                    on_measured=self._deviceShown,
+                                    path=path)
+        self._batchJob.signals.progress.connect(self.on_batchProgress)
+        self._batchJob.signals.finished.connect(self.on_batchFinished)
+        self._batchJob.signals.failed.connect(self.on_batchFailed)
+        self._ui.actBatch.setText('Остановить пакетное измерение')
+        self._lockBatch(True)
+        self._threads.start(self._batchJob)
+
+    def _lockBatch(self, locked):
+        # the batch owns the instruments until it is finished
+        self._measureWidget.setEnabled(not locked)
+        self._connectionWidget.setEnabled(not locked)
+        self._ui.actParams.setEnabled(not locked)
+
+    def on_deviceMeasured(self, serial):
+        self.on_measureComplete()
+        self._ui.statusbar.showMessage(f'Измерен образец {serial}')
+
+    @pyqtSlot(int, int)
+    def on_batchProgress(self, done, total):
+        self._ui.statusbar.showMessage(f'Пакетное измерение: {done} из {total}')
+
+    @pyqtSlot()
+    def on_batchFinished(self):
+        self._batchJob = None
+        self._ui.actBatch.setText('Пакетное измерение...')
+        self._lockBatch(False)
+        # a cancelled or failed device leaves its stream open
+        self._plotWidget.abort_stream()
+        self._ui.statusbar.showMessage('Пакетное измерение завершено')
+
+    @pyqtSlot(str)
+    def on_batchFailed(self, message):
+        self.on_batchFinished()
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка пакетного измерения: {message}')
+
+    @pyqtSlot()
+    def on_actCompare_triggered(self):
+        if self._compareJob is not None:
+            return
+
+        adjust_dirs = self._instrumentController.result.adjust_dirs
+        data = [(path, True) for path in adjust_dirs.values()]
+        values = fedit(data=data, title='Сравнение температур', comment='Первый выбранный набор - опорный')
+        if not values:
+            return
+
+        paths = [path for path, checked in zip(adjust_dirs.values(), values) if checked]
+        if len(paths) < 2:
+            QMessageBox.information(self, 'Сравнение температур', 'Выберите хотя бы два набора')
+            return
+
+        self._compareJob = MeasureJob(self._comparison.run, paths, dict(self._instrumentController.secondaryParams))
+        self._compareJob.signals.progress.connect(self.on_compareProgress)
+        self._compareJob.signals.finished.connect(self.on_compareFinished)
+        self._compareJob.signals.failed.connect(self.on_compareFailed)
+        self._threads.start(self._compareJob)
+
+    @pyqtSlot(int, int)
+    def on_compareProgress(self, done, total):
+        self._ui.statusbar.showMessage(f'Обработка наборов: {done} из {total}')
+
+    @pyqtSlot()
+    def on_compareFinished(self):
+        self._compareJob = None
+        self._ui.statusbar.clearMessage()
+        self._statWidget.stats = self._comparison.stats
 
+    @pyqtSlot(str)
+    def on_compareFailed(self, message):
+        self._compareJob = None
+        self._ui.statusbar.clearMessage()
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка сравнения наборов: {message}')
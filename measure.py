@@ -1,5 +1,6 @@
 import sys
 
+from multiprocessing import freeze_support
 from PyQt5.QtWidgets import QApplication
 from mainwindow import MainWindow
 
@@ -12,4 +13,5 @@ def main(args):
 
 
 if __name__ == '__main__':
+    freeze_support()
     main(sys.argv)
@@ -0,0 +1,97 @@
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QMessageBox
+
+
+class CancelToken:
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class MeasureJobSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+    failed = pyqtSignal(str)
+
+
+class MeasureJob(QRunnable):
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.token = CancelToken()
+        self.signals = MeasureJobSignals()
+
+    def run(self):
+        try:
+            self.fn(*self.args, token=self.token, progress=self.signals.progress.emit, **self.kwargs)
+        except Exception as ex:
+            traceback.print_exc()
+            self.signals.failed.emit(str(ex))
+            return
+        self.signals.finished.emit()
+
+    def cancel(self):
+        self.token.cancel()
+
+
+class OperatorPrompt(QObject):
+    asked = pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._event = threading.Event()
+        self._answer = False
+        self.asked.connect(self.on_asked)
+
+    def __call__(self, serial, device):
+        # called from the job thread, blocks until the operator answers in the GUI thread
+        self._event.clear()
+        self.asked.emit(serial, device)
+        self._event.wait()
+        return self._answer
+
+    @pyqtSlot(str, str)
+    def on_asked(self, serial, device):
+        answer = QMessageBox.question(self.parent(), 'Пакетное измерение',
+                                      f'Установите образец {serial} ({device}).\n'
+                                      f'"Да" - измерить, "Нет" - пропустить.')
+        self._answer = answer == QMessageBox.Yes
+        self._event.set()
+
+
+class GuiCall(QObject):
+    called = pyqtSignal(tuple)
+
+    def __init__(self, fn, parent=None):
+        super().__init__(parent)
+        self._fn = fn
+        self._event = threading.Event()
+        self._answer = None
+        self.called.connect(self.on_called)
+
+    def __call__(self, *args):
+        # called from the job thread, blocks until fn has run in the GUI thread
+        self._event.clear()
+        self.called.emit(args)
+        self._event.wait()
+        return self._answer
+
+    @pyqtSlot(tuple)
+    def on_called(self, args):
+        try:
+            self._answer = self._fn(*args)
+        finally:
+            self._event.set()
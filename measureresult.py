@@ -1,21 +1,34 @@
-import itertools
 import math
-import os
 import random
 import statistics
 
+import numpy as np
+
+from adjustcache import load_adjust_set
+from freqaxis import FreqAxis
+from sweepplan import stat_freqs
+
 
 def unwrap(xw):
     dist = 180
-    xu = list(xw)
-    for i in range(1, len(xw)):
-        diff = xw[i] - xw[i - 1]
+    xu = list(xw[:1])
+    offset = 0
+    for prev, cur in zip(xw, xw[1:]):
+        diff = cur - prev
         if diff > dist:
-            for j in range(i, len(xu)):
-                xu[j] -= 2 * dist
+            offset -= 2 * dist
         elif diff < -dist:
-            for j in range(i, len(xu)):
-                xu[j] += 2 * dist
+            offset += 2 * dist
+        xu.append(cur + offset)
+    return xu
+
+
+def unwrap_states(xw, dist=180):
+    xw = np.asarray(xw, dtype=float)
+    diff = np.diff(xw, axis=-1)
+    steps = np.where(diff > dist, -2 * dist, np.where(diff < -dist, 2 * dist, 0))
+    xu = xw.copy()
+    xu[..., 1:] += np.cumsum(steps, axis=-1)
     return xu
 
 
@@ -68,9 +81,47 @@ def generateValue(data):
     return round(random.randint(0, int((stop - start) / step)) * step + start, 2)
 
 
-def _find_freq_index(freqs: list, freq):
-    freq = freq * 1_000_000_000
-    return min(range(len(freqs)), key=lambda i: abs(freqs[i] - freq))
+def calc_vswr_np(in_mags):
+    modulated = np.power(10, np.asarray(in_mags, dtype=float) / 20)
+    return (1 + modulated) / (1 - modulated)
+
+
+def find_bands(values, levels):
+    # longest run of values above every level in one pass, exact start/stop indices, -1 for no run
+    values = np.asarray(values, dtype=float)
+    levels = np.asarray(levels, dtype=float).reshape(-1)
+    padded = np.zeros((len(levels), len(values) + 2), dtype=np.int8)
+    padded[:, 1:-1] = values[None, :] > levels[:, None]
+    # edges come in row order and alternate between run start and run end within a row
+    rows, cols = np.nonzero(np.diff(padded, axis=1))
+    rows, starts, stops = rows[::2], cols[::2], cols[1::2] - 1
+
+    band_starts = np.full(len(levels), -1)
+    band_stops = np.full(len(levels), -1)
+    if len(starts):
+        # per level: longest run first, the lowest one on a tie
+        order = np.lexsort((starts, starts - stops, rows))
+        first = order[np.r_[True, rows[order][1:] != rows[order][:-1]]]
+        band_starts[rows[first]] = starts[first]
+        band_stops[rows[first]] = stops[first]
+    return band_starts, band_stops
+
+
+def band_edges(freqs, values, level, start, stop, interpolate=False):
+    # band edge frequencies, optionally at the level crossing between the neighbouring points
+    def crossing(i, j):
+        return freqs[i] + (level - values[i]) * (freqs[j] - freqs[i]) / (values[j] - values[i])
+
+    if start < 0:
+        return None
+    f_min = freqs[start]
+    f_max = freqs[stop]
+    if interpolate:
+        if start > 0:
+            f_min = crossing(start - 1, start)
+        if stop < len(freqs) - 1:
+            f_max = crossing(stop, stop + 1)
+    return float(f_min), float(f_max)
 
 
 class MeasureResult:
@@ -107,10 +158,17 @@ class MeasureResult:
         self._s = 0
         self._kp_freq_min = 0
         self._kp_freq_max = 0
+        self._kp_bands = list()
+        self._freq_axis = None
 
         self._misc = list()
 
         self.adjust = False
+        # sparse sweeps (fast check) have too few points to unwrap phase along frequency or find the Kp band
+        self.sparse = False
+        # extra Kp levels reported next to the main one, dB
+        self.kp_levels = list()
+        self.kp_interpolate = False
         self._adjust_dir = self.adjust_dirs[1]
         self.ready = False
 
@@ -144,9 +202,12 @@ class MeasureResult:
         self._s = 0
         self._kp_freq_min = 0
         self._kp_freq_max = 0
+        self._kp_bands = list()
 
         self._min_freq_index = 0
+        self._mid_freq_index = 0
         self._max_freq_index = 0
+        self._freq_axis = None
 
         self._misc.clear()
 
@@ -174,10 +235,15 @@ class MeasureResult:
         self._vswr_out = [calc_vswr(s) for s in self._s22s]
 
     def _calc_phase_err(self):
-        self._s21s_ph = [unwrap(s) for s in self._s21s_ph]
+        if not self.sparse:
+            self._s21s_ph = [unwrap(s) for s in self._s21s_ph]
         ph0 = self._s21s_ph[0]
         self._s21s_ph_err = [calc_phase_error(s, ph0, ideal) for s, ideal in zip(self._s21s_ph[1:], self._volts[1:])]
-        self._s21s_ph_err = [norm_phase_error(s) for s in self._s21s_ph_err]
+        if self.sparse:
+            # every column is wrapped on its own
+            self._s21s_ph_err = [[a % 360 for a in s] for s in self._s21s_ph_err]
+        else:
+            self._s21s_ph_err = [norm_phase_error(s) for s in self._s21s_ph_err]
 
         for i in range(len(self._s21s_ph_err) - 1):
             ph_next = self._s21s_ph_err[i + 1][0]
@@ -192,13 +258,21 @@ class MeasureResult:
     def _calc_phase_v(self):
         i_min = 0
         i_max = len(self._s21s_ph_err[0]) - 1
-        i_mid = int(i_max / 2)
+        i_mid = self._mid_index()
         self._ph_v = [
             [0] + [s[i_min] for s in self._s21s_ph_err],
             [0] + [s[i_mid] for s in self._s21s_ph_err],
             [0] + [s[i_max] for s in self._s21s_ph_err]
         ]
 
+    def _calc_s(self):
+        # phase step around the middle state, a two state run has no step after the middle one
+        mid_index = len(self._ph_v[1]) // 2
+        if mid_index + 1 >= len(self._ph_v[1]):
+            self._s = 0.0
+            return
+        self._s = float(self._ph_v[1][mid_index + 1] - self._ph_v[1][mid_index])
+
     def _calc_s21_rmse(self):
         means = [statistics.mean(vs) for vs in zip(*self._s21s)]
         for *vs, mean in zip(*self._s21s_err, means):
@@ -220,11 +294,18 @@ class MeasureResult:
         else:
             return
 
-    def _calc_stats(self):
-        self._min_freq_index = _find_freq_index(self._freqs, self._secondaryParams['Fborder1'])
-        self._max_freq_index = _find_freq_index(self._freqs, self._secondaryParams['Fborder2'])
+    def _mid_index(self):
+        # the grid may be segmented, the middle is looked up by frequency rather than by index
+        freqs = self.freq_axis.freqs
+        return self.freq_axis.index((freqs[0] + freqs[-1]) / 2)
 
-        mid = self._min_freq_index + abs(self._max_freq_index - self._min_freq_index) // 2
+    def _stat_indexes(self):
+        self._min_freq_index, self._mid_freq_index, self._max_freq_index = \
+            [self.freq_axis.index_ghz(f) for f in stat_freqs(self._secondaryParams)]
+        return [self._min_freq_index, self._mid_freq_index, self._max_freq_index]
+
+    def _calc_stats(self):
+        _, mid, _ = self._stat_indexes()
 
         vs = list(zip(*self.s21))
         self._s21_mins = [min(vs[self._min_freq_index]), min(vs[mid]), min(vs[self._max_freq_index])]
@@ -244,74 +325,42 @@ class MeasureResult:
         vs = list(zip(*self.s21_err))
         self._s21_err_max = [max(abs(v) for v in vs[self._min_freq_index]), max(abs(v) for v in vs[mid]), max(abs(v) for v in vs[self._max_freq_index])]
 
-        mid_index = len(self._ph_v[1]) // 2
-        self._s = self._ph_v[1][mid_index + 1] - self._ph_v[1][mid_index]
+        self._calc_s()
 
-    def _cal_s21_worst_loss(self):
-        min_index = _find_freq_index(self._freqs, self._secondaryParams['Fborder1'])
-        max_index = _find_freq_index(self._freqs, self._secondaryParams['Fborder2'])
-
-        # min_index = 0
-        # max_index = len(self._freqs) - 1
+    def _s21_column_mins(self):
+        return np.min(self._s21s, axis=0)
 
+    def _cal_s21_worst_loss(self):
         level = self._secondaryParams['kp']
-        mins = [min(vals) for vals in zip(*self._s21s)]
-        res = itertools.groupby(mins, key=lambda x: x > level)
-        res = [list(ls) for val, ls in res if val]
-        if not res:
+        levels = [level] + [lvl for lvl in self.kp_levels if lvl != level]
+        if self.sparse:
+            self._kp_bands = [[lvl, 'n/a', 'n/a'] for lvl in levels]
             self._kp_freq_min = 'n/a'
             self._kp_freq_max = 'n/a'
             return
-        elif len(res) != len(self._freqs):
-            max_size = max(len(el) for el in res)
-            res = list(filter(lambda x: len(x) == max_size, res))[0]
-            min_index = mins.index(res[0])
-            max_index = mins.index(res[-1])
-        self._kp_freq_min = round(self._freqs[min_index] / 1_000_000_000, 2)
-        self._kp_freq_max = round(self._freqs[max_index] / 1_000_000_000, 2)
-
-    def _list_s2p(self):
-        path = f'./{self.adjust_set}'
-        return [f'{path}/{f}' for f in (os.listdir(path)) if os.path.isfile(f'{path}/{f}') and f.endswith('.s2p')]
+
+        mins = self._s21_column_mins()
+        freqs = self.freq_axis.freqs
+
+        self._kp_bands = list()
+        for lvl, start, stop in zip(levels, *find_bands(mins, levels)):
+            edges = band_edges(freqs, mins, lvl, start, stop, interpolate=self.kp_interpolate)
+            f_min, f_max = [round(f / 1_000_000_000, 2) for f in edges] if edges else ['n/a', 'n/a']
+            self._kp_bands.append([lvl, f_min, f_max])
+
+        _, self._kp_freq_min, self._kp_freq_max = self._kp_bands[0]
 
     def _load_ideal(self):
         print(f'reading adjust set from: {self.adjust_set}/')
-        files = self._list_s2p()
-        volts = []
-        sorted_files = sorted([(float(file.split('/')[-1][:-4].replace('_', '.')), file) for file in files], key=lambda el: el[0])
-        for volt, file in sorted_files:
-            volts.append(volt)
-            with open(f'{file}', mode='rt', encoding='utf-8') as f:
-                fs = []
-                s11dbs = []
-                s11degs = []
-                s21dbs = []
-                s21degs = []
-                s12dbs = []
-                s12degs = []
-                s22dbs = []
-                s22degs = []
-
-                for line in list(f.readlines())[5:]:
-                    res = map(float, line.strip().split())
-                    frq, s11db, s11deg, s21db, s21deg, s12db, s12deg, s22db, s22deg = res
-                    fs.append(frq)
-                    s11dbs.append(s11db)
-                    s11degs.append(s11deg)
-                    s21dbs.append(s21db)
-                    s21degs.append(s21deg)
-                    s12dbs.append(s12db)
-                    s12degs.append(s12deg)
-                    s22dbs.append(s22db)
-                    s22degs.append(s22deg)
-
-            self._s11s.append(s11dbs)
-            self._s21s.append(s21dbs)
-            self._s21s_ph.append(s21degs)
-            self._s22s.append(s22dbs)
+        volts, freqs, mags, phases = load_adjust_set(f'./{self.adjust_set}')
+
+        self._s11s = list(mags[:, :, 0])
+        self._s21s = list(mags[:, :, 1])
+        self._s21s_ph = list(phases[:, :, 1])
+        self._s22s = list(mags[:, :, 3])
 
         self._volts = volts
-        self._freqs = fs
+        self._freqs = list(freqs)
         self._process()
 
     @property
@@ -351,6 +400,13 @@ class MeasureResult:
     def freqs(self):
         return self._freqs
 
+    @property
+    def freq_axis(self):
+        # built once per sweep and shared by the stats and the plots
+        if self._freq_axis is None or len(self._freq_axis) != len(self._freqs):
+            self._freq_axis = FreqAxis(self._freqs)
+        return self._freq_axis
+
     @property
     def s21(self):
         return self._s21s
@@ -398,14 +454,19 @@ class MeasureResult:
     @property
     def stats(self):
         low = self._min_freq_index
+        mid = self._mid_freq_index
         high = self._max_freq_index
-        mid = low + (high - low) // 2
         f1 = round(self.freqs[low] / 1_000_000_000, 2)
         f2 = round(self.freqs[mid] / 1_000_000_000, 2)
         f3 = round(self.freqs[high] / 1_000_000_000, 2)
 
         kp_freq_min = f'{self._kp_freq_min:.02f} ГГц' if self._kp_freq_min != 'n/a' else 'n/a'
         kp_freq_max = f'{self._kp_freq_max:.02f} ГГц' if self._kp_freq_max != 'n/a' else 'n/a'
+        if self.sparse:
+            kp_freq_min = kp_freq_max = 'не определяется по точкам быстрой проверки'
+        bands = ''.join(f'---\nПолоса по уровню {level} дБ:\n' +
+                        (f'{f_min:.02f} - {f_max:.02f} ГГц\n' if f_min != 'n/a' else 'n/a\n')
+                        for level, f_min, f_max in self._kp_bands[1:])
         return f'''Потери, минимум:
 {self._s21_mins[0]:.02f} дБ на {f1} ГГц
 {self._s21_mins[1]:.02f} дБ на {f2} ГГц
@@ -434,4 +495,236 @@ S:
 ---
 Верхняя граница РЧ, Fв:
 {kp_freq_max}
-'''
+{bands}'''
+
+
+class VectorMeasureResult(MeasureResult):
+    _array_fields = ['_freqs', '_s21s', '_s21s_err', '_s21s_ph', '_s21s_ph_err', '_ph_v', '_s11s', '_s22s',
+                     '_vswr_in', '_vswr_out']
+
+    def __init__(self):
+        super().__init__()
+        self._live = False
+        self._count = 0
+        self._points = 0
+        self._stat_cols = []
+        self._s21_sum = None
+        self._s21_col_mins = None
+        self._raw = np.zeros((0, 9, 0))
+
+    def _init(self):
+        # processed fields are replaced with arrays, fresh lists are needed for the loaders
+        for name in self._array_fields:
+            setattr(self, name, list())
+        super()._init()
+        self.ready = False
+        self._live = False
+        self._count = 0
+        self._raw = np.zeros((0, 9, 0))
+
+    def _set_raw(self, raw):
+        # states x 9 x points SNP block, the trace arrays are views into it
+        self._raw = raw
+        self._freqs = raw[0, 0] if len(raw) else np.zeros(raw.shape[2])
+        self._s11s = raw[:, 1]
+        self._s21s = raw[:, 3]
+        self._s21s_ph = raw[:, 4]
+        self._s22s = raw[:, 7]
+
+    def begin(self, points, volts, secondary):
+        self._init()
+        self._live = True
+        self._points = int(points)
+        self._volts = list(volts)
+        self._secondaryParams = dict(secondary)
+
+        states = len(self._volts)
+        self._set_raw(np.zeros((states, 9, self._points)))
+        self._s21s_ph = np.zeros((states, self._points))
+        self._vswr_in = np.zeros((states, self._points))
+        self._vswr_out = np.zeros((states, self._points))
+        self._s21s_ph_err = np.zeros((max(states - 1, 0), self._points))
+
+        self._s21_sum = np.zeros(self._points)
+        self._s21_col_mins = np.full(self._points, np.inf)
+        self._s21_mins = [np.inf] * 3
+        self._vswr_in_max = [-np.inf] * 3
+        self._vswr_out_max = [-np.inf] * 3
+        self._phase_err_max = [0.0] * 3
+
+    def append_state(self, pars):
+        i = self._count
+        self._raw[i] = np.reshape(pars, (9, self._points))
+        pars = self._raw[i]
+        if i == 0:
+            self._stat_cols = self._stat_indexes()
+
+        self._s21s_ph[i] = pars[4] if self.sparse else unwrap_states(pars[4])
+        self._vswr_in[i] = calc_vswr_np(pars[1])
+        self._vswr_out[i] = calc_vswr_np(pars[7])
+
+        self._s21_sum += pars[3]
+        np.minimum(self._s21_col_mins, pars[3], out=self._s21_col_mins)
+
+        cols = self._stat_cols
+        self._s21_mins = np.minimum(self._s21_mins, self._s21s[i, cols]).tolist()
+        self._vswr_in_max = np.maximum(self._vswr_in_max, self._vswr_in[i, cols]).tolist()
+        self._vswr_out_max = np.maximum(self._vswr_out_max, self._vswr_out[i, cols]).tolist()
+
+        if i > 0:
+            err = self._s21s_ph_err[i - 1]
+            err[:] = self._s21s_ph[i] - self._s21s_ph[0]
+            if self.sparse:
+                err %= 360
+            elif (err < 0).any():
+                err += 360
+            if i > 1 and err[0] - self._s21s_ph_err[i - 2, 0] < -250:
+                err += 360
+            self._phase_err_max = np.maximum(self._phase_err_max, np.abs(err[cols])).tolist()
+
+        self._count += 1
+
+    def finish(self):
+        if self.adjust:
+            secondary = self._secondaryParams
+            self._init()
+            self._secondaryParams = secondary
+            self._load_ideal()
+            return
+
+        n = self._count
+        self._live = False
+        if n < 2:
+            # phase error needs the reference state and at least one more
+            return
+
+        phase = self._s21s_ph[:n]
+        self._set_raw(self._raw[:n])
+        self._s21s_ph = phase
+        self._vswr_in = self._vswr_in[:n]
+        self._vswr_out = self._vswr_out[:n]
+        self._s21s_ph_err = self._s21s_ph_err[:n - 1]
+        self._volts = self._volts[:n]
+
+        mean = self._s21_sum / n
+        self._s21s_err = self._s21s - mean
+        cols = self._stat_cols
+        self._s21_err_max = np.abs(self._s21s_err[:, cols]).max(axis=0).tolist()
+
+        self._calc_phase_v()
+        self._calc_s()
+
+        self._cal_s21_worst_loss()
+        self.ready = True
+
+    @property
+    def raw_data(self):
+        return True
+
+    @raw_data.setter
+    def raw_data(self, args):
+        print('process result')
+        self._init()
+
+        points = int(args[0])
+        s2p = args[1]
+        self._volts = list(args[2])
+        self._secondaryParams = dict(args[3])
+
+        if self.adjust:
+            self._load_ideal()
+            return
+
+        if isinstance(s2p, np.ndarray):
+            raw = s2p.astype(float, copy=False).reshape(len(s2p), 9, points)
+        else:
+            raw = np.empty((len(s2p), 9, points))
+            for i, pars in enumerate(s2p):
+                raw[i] = np.reshape(pars, (9, points))
+        self._set_raw(raw)
+        self._process()
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def raw(self):
+        return self._raw
+
+    @property
+    def s21_err(self):
+        if self._live:
+            n = self._count
+            return self._s21s[:n] - self._s21_sum / max(n, 1)
+        return self._s21s_err
+
+    def _process(self):
+        self._freqs = np.asarray(self._freqs, dtype=float)
+        self._s11s = np.asarray(self._s11s, dtype=float)
+        self._s21s = np.asarray(self._s21s, dtype=float)
+        self._s21s_ph = np.asarray(self._s21s_ph, dtype=float)
+        self._s22s = np.asarray(self._s22s, dtype=float)
+        super()._process()
+
+    def _calc_vwsr_in(self):
+        self._vswr_in = calc_vswr_np(self._s11s)
+
+    def _calc_vwsr_out(self):
+        self._vswr_out = calc_vswr_np(self._s22s)
+
+    def _calc_phase_err(self):
+        if not self.sparse:
+            self._s21s_ph = unwrap_states(self._s21s_ph)
+        err = self._s21s_ph[1:] - self._s21s_ph[0]
+        if self.sparse:
+            # every column is wrapped on its own
+            err %= 360
+        else:
+            err[(err < 0).any(axis=1)] += 360
+
+        # each row depends on the already normalized previous one, only the first column is walked
+        for i in range(len(err) - 1):
+            if err[i + 1, 0] - err[i, 0] < -250:
+                err[i + 1] += 360
+        self._s21s_ph_err = err
+
+    def _calc_s21_err(self):
+        self._s21s_err = self._s21s - self._s21s.mean(axis=0)
+
+    def _calc_phase_v(self):
+        i_max = self._s21s_ph_err.shape[1] - 1
+        cols = self._s21s_ph_err[:, [0, self._mid_index(), i_max]].T
+        self._ph_v = np.hstack([np.zeros((3, 1)), cols])
+
+    def _calc_s21_rmse(self):
+        self._s21s_rmse = np.sqrt(np.mean(np.square(self._s21s_err), axis=0))
+
+    def _adjust_data(self, what):
+        if what == 'err':
+            err_mul = random.uniform(0.95, 1.05)
+            self._s21s_err = self._s21s_err * err_mul
+            self._s21s_ph_err = self._s21s_ph_err * err_mul
+        elif what == 's21':
+            self._s21s = self._s21s + random.uniform(-0.2, 0.2)
+        elif what == 'vswr':
+            vswr_in_shift = random.uniform(-0.05, 0.05)
+            vswr_out_shift = random.uniform(-0.05, 0.05)
+            self._vswr_in = self._vswr_in + vswr_in_shift
+            self._vswr_out = self._vswr_out + vswr_out_shift
+        else:
+            return
+
+    def _calc_stats(self):
+        cols = self._stat_indexes()
+
+        self._s21_mins = self._s21s[:, cols].min(axis=0).tolist()
+        self._vswr_in_max = self._vswr_in[:, cols].max(axis=0).tolist()
+        self._vswr_out_max = self._vswr_out[:, cols].max(axis=0).tolist()
+        self._phase_err_max = np.abs(self._s21s_ph_err[:, cols]).max(axis=0).tolist()
+        self._s21_err_max = np.abs(self._s21s_err[:, cols]).max(axis=0).tolist()
+
+        self._calc_s()
+
+    def _s21_column_mins(self):
+        return self._s21_col_mins if self._count else self._s21s.min(axis=0)
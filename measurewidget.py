@@ -3,6 +3,7 @@ from PyQt5.QtCore import pyqtSlot, pyqtSignal, QRunnable, QThreadPool
 from PyQt5.QtWidgets import QWidget, QComboBox, QLabel, QMessageBox, QDoubleSpinBox, QSpinBox
 
 from deviceselectwidget import DeviceSelectWidget
+from measurejob import MeasureJob
 
 
 class MeasureTask(QRunnable):
@@ -25,6 +26,8 @@ class MeasureWidget(QWidget):
     sampleFound = pyqtSignal()
     measureComplete = pyqtSignal()
     measureStarted = pyqtSignal()
+    # a run ended without a result to show: failed or cancelled too early
+    measureAborted = pyqtSignal()
 
     def __init__(self, parent=None, controller=None):
         super().__init__(parent=parent)
@@ -32,6 +35,7 @@ class MeasureWidget(QWidget):
         self._ui = uic.loadUi('measurewidget.ui', self)
         self._controller = controller
         self._threads = QThreadPool()
+        self._job = None
 
         self._devices = DeviceSelectWidget(parent=self, params=self._controller.deviceParams)
         self._ui.layParams.insertWidget(0, self._devices)
@@ -61,20 +65,46 @@ class MeasureWidget(QWidget):
     def measure(self):
         print('measuring...')
         self._modeDuringMeasure()
-        self._threads.start(MeasureTask(self._controller.measure,
-                                        self.measureTaskComplete,
-                                        self._selectedDevice))
+        self._startMeasureJob(self._selectedDevice)
+
+    @property
+    def busy(self):
+        return self._job is not None
+
+    def _startMeasureJob(self, params):
+        self._job = MeasureJob(self._controller.measure, params)
+        self._job.signals.progress.connect(self.on_measureProgress)
+        self._job.signals.finished.connect(self.measureTaskComplete)
+        self._job.signals.failed.connect(self.on_measureFailed)
+        self._ui.progressMeasure.setValue(0)
+        self._threads.start(self._job)
 
     def measureTaskComplete(self):
         print('measure complete')
-        # TODO check if measure completed successfully?
+        self._job = None
+        self._modePreCheck()
+        if self._controller.cancelled:
+            print('measurement cancelled, keeping partial result')
         if not self._controller.hasResult:
-            print('error during measurement')
+            print('no result to show')
+            self.measureAborted.emit()
             return
 
-        self._modePreCheck()
         self.measureComplete.emit()
 
+    @pyqtSlot(int, int)
+    def on_measureProgress(self, done, total):
+        self._ui.progressMeasure.setMaximum(total)
+        self._ui.progressMeasure.setValue(done)
+
+    @pyqtSlot(str)
+    def on_measureFailed(self, message):
+        print(f'error during measurement: {message}')
+        self._job = None
+        self._modePreCheck()
+        self.measureAborted.emit()
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка измерения: {message}')
+
     @pyqtSlot()
     def on_instrumentsConnected(self):
         self._modePreCheck()
@@ -90,6 +120,13 @@ class MeasureWidget(QWidget):
         self.measureStarted.emit()
         self.measure()
 
+    @pyqtSlot()
+    def on_btnCancel_clicked(self):
+        print('cancel measure')
+        if self._job is not None:
+            self._job.cancel()
+        self._ui.btnCancel.setEnabled(False)
+
     @pyqtSlot(str)
     def on_selectedChanged(self, value):
         self._selectedDevice = value
@@ -98,26 +135,31 @@ class MeasureWidget(QWidget):
     def _modePreConnect(self):
         self._ui.btnCheck.setEnabled(False)
         self._ui.btnMeasure.setEnabled(False)
+        self._ui.btnCancel.setEnabled(False)
         self._devices.enabled = True
 
     def _modePreCheck(self):
         self._ui.btnCheck.setEnabled(True)
         self._ui.btnMeasure.setEnabled(False)
+        self._ui.btnCancel.setEnabled(False)
         self._devices.enabled = True
 
     def _modeDuringCheck(self):
         self._ui.btnCheck.setEnabled(False)
         self._ui.btnMeasure.setEnabled(False)
+        self._ui.btnCancel.setEnabled(False)
         self._devices.enabled = False
 
     def _modePreMeasure(self):
         self._ui.btnCheck.setEnabled(False)
         self._ui.btnMeasure.setEnabled(True)
+        self._ui.btnCancel.setEnabled(False)
         self._devices.enabled = False
 
     def _modeDuringMeasure(self):
         self._ui.btnCheck.setEnabled(False)
         self._ui.btnMeasure.setEnabled(False)
+        self._ui.btnCancel.setEnabled(True)
         self._devices.enabled = False
 
 
@@ -253,9 +295,7 @@ class MeasureWidgetWithSecondaryParameters(MeasureWidget):
     def measure(self):
         print('subclass measuring...')
         self._modeDuringMeasure()
-        self._threads.start(MeasureTask(self._controller.measure,
-                                        self.measureTaskComplete,
-                                        [self._selectedDevice, self._params]))
+        self._startMeasureJob([self._selectedDevice, self._params])
 
     @pyqtSlot(float)
     def on_spinFreqStart_valueChanged(self, value):
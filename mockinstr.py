@@ -0,0 +1,262 @@
+import math
+import re
+import time
+
+import numpy as np
+
+from scpiblock import make_binary_block
+
+
+class MockSource:
+
+    def __init__(self, addr='mock'):
+        self.addr = addr
+        self.voltage = 0.0
+        self.current = 0.0
+        self.output = 'OFF'
+
+    def find(self):
+        return self
+
+    def set_current(self, chan, value, unit):
+        self.current = value
+
+    def set_voltage(self, chan, value, unit):
+        self.voltage = value
+
+    def read_voltage(self, chan):
+        return self.voltage
+
+    def set_output(self, chan, state):
+        self.output = state
+
+    @property
+    def status(self):
+        return f'{self.addr} mock source'
+
+
+class MockAnalyzer:
+
+    def __init__(self, source, addr='mock', path='ref/sample_data'):
+        self.addr = addr
+        self._source = source
+        self._path = path
+        self._format = 'ASCII'
+
+    def find(self):
+        return self
+
+    def send(self, command):
+        if command.startswith('FORM:DATA'):
+            self._format = command.split(maxsplit=1)[1].strip()
+
+    def query(self, question):
+        if question == '*OPC?':
+            return '1'
+        if question.startswith('CALC1:DATA:SNP?'):
+            return self._read_snp()
+        return ''
+
+    def query_raw(self, question):
+        if self._format == 'ASCII' or not question.startswith('CALC1:DATA:SNP?'):
+            return f'{self.query(question)}\n'.encode('ascii')
+        values = [float(x) for x in self._read_snp().split(',')]
+        return make_binary_block(values, self._format) + b'\n'
+
+    def _read_snp(self):
+        fn = f'{self._path}/out_s{self._source.voltage:05.2f}.s2p'
+        with open(fn, mode='rt', encoding='utf-8') as f:
+            return f.readline().strip()
+
+    @property
+    def status(self):
+        return f'{self.addr} mock analyzer, {self._format}'
+
+
+def phase_shifter_model(freqs, volt, noise=0.0, rng=None):
+    # simple varactor-loaded line: phase shift saturates with control voltage, loss grows with it
+    f = np.asarray(freqs, dtype=float) / 1_000_000_000
+    shift = 360 * (1 - np.exp(-volt / 4)) * f / f.mean()
+    s21_db = -2.5 - 0.15 * f - 0.08 * volt
+    s21_deg = -36 * f * 10 - shift
+    s11_db = -18 + 3 * np.cos(f * 2 + volt / 3)
+    s22_db = -17 + 3 * np.sin(f * 2 - volt / 3)
+    if noise:
+        rng = rng or np.random.default_rng()
+        s21_db = s21_db + rng.normal(0, noise, f.shape)
+        s21_deg = s21_deg + rng.normal(0, noise * 10, f.shape)
+    s21_deg = (s21_deg + 180) % 360 - 180
+    zeros = np.zeros_like(f)
+    return np.concatenate([freqs, s11_db, zeros, s21_db, s21_deg, s21_db, s21_deg, s22_db, zeros])
+
+
+class SimSource:
+
+    def __init__(self, addr='sim', latency=0.002, tau=0.05):
+        self.addr = addr
+        self.latency = latency
+        self.tau = tau
+        self.current = 0.0
+        self.output = 'OFF'
+        self._from = 0.0
+        self._to = 0.0
+        self._since = time.perf_counter()
+
+    def find(self):
+        return self
+
+    def set_current(self, chan, value, unit):
+        time.sleep(self.latency)
+        self.current = value
+
+    def set_voltage(self, chan, value, unit):
+        time.sleep(self.latency)
+        self._from = self.voltage
+        self._to = value
+        self._since = time.perf_counter()
+
+    def set_output(self, chan, state):
+        time.sleep(self.latency)
+        self.output = state
+
+    def send(self, command):
+        time.sleep(self.latency)
+
+    def query(self, question):
+        time.sleep(self.latency)
+        if question.startswith('MEAS:VOLT?'):
+            return f'{self.voltage:.4f}'
+        return ''
+
+    def read_voltage(self, chan):
+        return self.query(f'MEAS:VOLT? (@{chan})')
+
+    @property
+    def voltage(self):
+        elapsed = time.perf_counter() - self._since
+        return self._to + (self._from - self._to) * math.exp(-elapsed / self.tau)
+
+    @property
+    def target(self):
+        return self._to
+
+    @property
+    def status(self):
+        return f'{self.addr} simulated source'
+
+
+class SimAnalyzer:
+
+    def __init__(self, source, addr='sim', latency=0.002, point_time=50e-6, transfer_rate=1_000_000,
+                 save_time=0.2, noise=0.0):
+        self.addr = addr
+        self.latency = latency
+        self.point_time = point_time
+        self.transfer_rate = transfer_rate
+        self.save_time = save_time
+        self.noise = noise
+        self._source = source
+        self._rng = np.random.default_rng(0)
+        self._preset()
+
+    def _preset(self):
+        self.start = 10e6
+        self.stop = 20e9
+        self.points = 201
+        self.format = 'ASCII'
+        self.mode = 'CONT'
+        self.sweep_type = 'LIN'
+        self.segments = dict()
+        self._sweep_end = 0.0
+        self._sweep_volt = self._source.target
+
+    def find(self):
+        return self
+
+    @property
+    def freqs(self):
+        if self.sweep_type == 'SEGM':
+            segments = [self.segments[k] for k in sorted(self.segments)]
+            return np.concatenate([np.linspace(s['start'], s['stop'], s['points']) for s in segments if s['on']])
+        return np.linspace(self.start, self.stop, self.points)
+
+    @property
+    def sweep_time(self):
+        return len(self.freqs) * self.point_time
+
+    def _segment(self, head, arg):
+        match = re.match(r'SENS1:SEGM(\d+)(:.*)?', head)
+        index, field = int(match.group(1)), match.group(2) or ''
+        segment = self.segments.setdefault(index, {'start': self.start, 'stop': self.stop, 'points': 1, 'on': False})
+        if field == ':FREQ:STAR':
+            segment['start'] = float(arg.upper().replace('GHZ', '')) * 1_000_000_000
+        elif field == ':FREQ:STOP':
+            segment['stop'] = float(arg.upper().replace('GHZ', '')) * 1_000_000_000
+        elif field == ':SWE:POIN':
+            segment['points'] = int(arg)
+        elif not field:
+            segment['on'] = arg == 'ON'
+
+    def send(self, command):
+        time.sleep(self.latency)
+        head, _, arg = command.partition(' ')
+        arg = arg.strip()
+        if head == 'SYST:PRES':
+            self._preset()
+        elif head == 'SENS1:SWE:POIN':
+            self.points = int(arg)
+        elif head == 'SENS1:FREQ:STAR':
+            self.start = float(arg.upper().replace('GHZ', '')) * 1_000_000_000
+        elif head == 'SENS1:FREQ:STOP':
+            self.stop = float(arg.upper().replace('GHZ', '')) * 1_000_000_000
+        elif head == 'SENS1:SWE:TYPE':
+            self.sweep_type = arg
+        elif head == 'SENS1:SEGM:DEL:ALL':
+            self.segments.clear()
+        elif head.startswith('SENS1:SEGM'):
+            self._segment(head, arg)
+        elif head == 'FORM:DATA':
+            self.format = arg
+        elif head == 'SENS1:SWE:MODE':
+            self.mode = arg
+            if arg == 'SING':
+                self._sweep_volt = self._source.voltage
+                self._sweep_end = time.perf_counter() + self.sweep_time
+        elif head in ('MMEM:STOR', 'CALC:DATA:SNP:PORTs:Save'):
+            time.sleep(self.save_time)
+
+    def query(self, question):
+        time.sleep(self.latency)
+        if question == '*OPC?':
+            self._wait_sweep()
+            return '1'
+        if question.startswith('CALC1:DATA:SNP?'):
+            values = self._snp()
+            text = ','.join(f'{v:+.9e}' for v in values)
+            time.sleep(len(text) / self.transfer_rate)
+            return text
+        return ''
+
+    def query_raw(self, question):
+        if self.format == 'ASCII' or not question.startswith('CALC1:DATA:SNP?'):
+            return f'{self.query(question)}\n'.encode('ascii')
+        time.sleep(self.latency)
+        block = make_binary_block(self._snp(), self.format) + b'\n'
+        time.sleep(len(block) / self.transfer_rate)
+        return block
+
+    def _wait_sweep(self):
+        if self.mode == 'CONT':
+            # a continuous sweep is only consistent once it has run entirely after the last source change
+            self._sweep_volt = self._source.voltage
+            self._sweep_end = time.perf_counter() + self.sweep_time
+        remaining = self._sweep_end - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _snp(self):
+        return phase_shifter_model(self.freqs, self._sweep_volt, noise=self.noise, rng=self._rng)
+
+    @property
+    def status(self):
+        return f'{self.addr} simulated analyzer, {self.format}'
@@ -0,0 +1,83 @@
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# format name -> (file suffix, extension, dpi), vector formats ignore dpi
+export_formats = {
+    'thumb': ('_thumb', 'png', 50),
+    'full': ('', 'png', 400),
+    'svg': ('', 'svg', None),
+    'pdf': ('', 'pdf', None),
+}
+
+default_formats = ('thumb', 'full', 'svg')
+
+
+def render_figure(snapshot, path, formats=default_formats):
+    # runs in a worker process, plain Agg canvas without pyplot or Qt
+    fig = Figure(figsize=snapshot.get('size', (6.4, 4.8)))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.set_xlabel(snapshot['xlabel'], labelpad=-2)
+    ax.set_ylabel(snapshot['ylabel'], labelpad=-2)
+    ax.grid(True, which='major', color='0.5', linestyle='-')
+    for xs, ys in snapshot['lines']:
+        ax.plot(xs, ys)
+    if snapshot.get('hline') is not None:
+        ax.axhline(snapshot['hline'], 0, 1, linewidth=0.8, color='0.3', linestyle='-')
+    fig.tight_layout()
+
+    files = []
+    for name in formats:
+        suffix, ext, dpi = export_formats[name]
+        file = f'{path}{suffix}.{ext}'
+        fig.savefig(file, dpi=dpi) if dpi else fig.savefig(file)
+        files.append(file)
+    return files
+
+
+class PlotExporter(QObject):
+    exported = pyqtSignal(str, list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, workers=2):
+        super().__init__(parent)
+        self.workers = workers
+        self._pool = None
+
+    def export(self, snapshots, img_path, formats=default_formats):
+        os.makedirs(img_path, exist_ok=True)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        futures = [self._pool.submit(render_figure, snapshot, os.path.join(img_path, name), formats)
+                   for name, snapshot in snapshots]
+
+        # done callbacks run on the pool thread, the signals are queued to the GUI thread
+        lock = threading.Lock()
+        pending = [len(futures)]
+
+        def on_done(_):
+            with lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            errors = [f.exception() for f in futures if f.exception()]
+            if errors:
+                self.failed.emit(str(errors[0]))
+            else:
+                self.exported.emit(img_path, [file for f in futures for file in f.result()])
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        return futures
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
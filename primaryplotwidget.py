@@ -1,12 +1,34 @@
-import errno
 import itertools
-import os
 
+import numpy as np
+
+from PyQt5.QtCore import QTimer, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import QGridLayout, QWidget
 from mytools.plotwidget import PlotWidget
+from plotexport import PlotExporter, default_formats
+from tracecollection import TraceCollection
+
+
+def setup_plot(plot, pars: dict):
+    plot.set_tight_layout(True)
+    plot.subplots_adjust(bottom=0.150)
+    # plot.set_title(pars['title'])
+    plot.set_xlabel(pars['xlabel'], labelpad=-2)
+    plot.set_ylabel(pars['ylabel'], labelpad=-2)
+    # plot.set_xlim(pars['xlim'][0], pars['xlim'][1])
+    # plot.set_ylim(pars['ylim'][0], pars['ylim'][1])
+    plot.grid(b=True, which='major', color='0.5', linestyle='-')
+    plot.tight_layout()
+
+
+def plot_axes(plot):
+    # PlotWidget only forwards Axes methods, the x axis knows the Axes itself
+    return plot.get_xaxis().axes
 
 
 class PrimaryPlotWidget(QWidget):
+    saved = pyqtSignal(str, list)
+    saveFailed = pyqtSignal(str)
 
     params = {
         0: {
@@ -66,6 +88,8 @@ class PrimaryPlotWidget(QWidget):
 
         self._result = result
         self.only_main_states = False
+        self.streaming = True
+        self.stream_interval = 250
 
         self._grid = QGridLayout()
 
@@ -89,21 +113,33 @@ class PrimaryPlotWidget(QWidget):
 
         self.setLayout(self._grid)
 
-        self._init()
+        # streamed plots with the result row offset of their first trace
+        self._streams = [
+            (self._plotS21, 's21', 0),
+            (self._plotVswrIn, 'vswr_in', 0),
+            (self._plotVswrOut, 'vswr_out', 0),
+            (self._plotS21PhaseErr, 'phase_err', 1),
+        ]
+        self._streamLines = {plot: list() for plot, _, _ in self._streams}
+        self._backgrounds = dict()
+        # draw_event connections that refresh the backgrounds while streaming
+        self._drawCids = dict()
+        # dense traces are drawn as one decimated collection per plot
+        self._traces = dict()
+        self._streamShown = 0
+        self._streamCount = 0
+        self._streamZero = None
 
-    def _init(self, dev_id=0):
+        self._streamTimer = QTimer(self)
+        self._streamTimer.timeout.connect(self._flush_stream)
 
-        def setup_plot(plot, pars: dict):
-            plot.set_tight_layout(True)
-            plot.subplots_adjust(bottom=0.150)
-            # plot.set_title(pars['title'])
-            plot.set_xlabel(pars['xlabel'], labelpad=-2)
-            plot.set_ylabel(pars['ylabel'], labelpad=-2)
-            # plot.set_xlim(pars['xlim'][0], pars['xlim'][1])
-            # plot.set_ylim(pars['ylim'][0], pars['ylim'][1])
-            plot.grid(b=True, which='major', color='0.5', linestyle='-')
-            plot.tight_layout()
+        self._exporter = PlotExporter(self)
+        self._exporter.exported.connect(self.saved)
+        self._exporter.failed.connect(self.saveFailed)
 
+        self._init()
+
+    def _init(self, dev_id=0):
         setup_plot(self._plotS21, self.params[dev_id]['00'])
         setup_plot(self._plotVswrIn, self.params[dev_id]['01'])
         setup_plot(self._plotVswrOut, self.params[dev_id]['10'])
@@ -114,6 +150,12 @@ class PrimaryPlotWidget(QWidget):
         # setup_plot(self._plotMisc, self.params[dev_id]['13'])
 
     def clear(self):
+        for trace in self._traces.values():
+            trace.remove()
+        self._traces.clear()
+        self._streamLines = {plot: list() for plot, _, _ in self._streams}
+        self._backgrounds.clear()
+        self._streamZero = None
         self._plotS21.clear()
         self._plotVswrIn.clear()
         self._plotVswrOut.clear()
@@ -128,7 +170,7 @@ class PrimaryPlotWidget(QWidget):
         self.clear()
         self._init(dev_id)
 
-        freqs = self._result.freqs
+        axis = self._result.freq_axis
         s21s = self._result.s21
         vswr_in = self._result.vswr_in
         vswr_out = self._result.vswr_out
@@ -139,19 +181,10 @@ class PrimaryPlotWidget(QWidget):
         # s21_rmse = self._result.s21_rmse
         # misc = self._result.misc
 
-        n = len(s21s)
-
-        for xs, ys in zip(itertools.repeat(freqs, n), s21s):
-            self._plotS21.plot(xs, ys)
-
-        for xs, ys in zip(itertools.repeat(freqs, n), vswr_in):
-            self._plotVswrIn.plot(xs, ys)
-
-        for xs, ys in zip(itertools.repeat(freqs, n), vswr_out):
-            self._plotVswrOut.plot(xs, ys)
-
-        for xs, ys in zip(itertools.repeat(freqs, n - 1), phase_errs):
-            self._plotS21PhaseErr.plot(xs, ys)
+        self._show_traces(self._plotS21, axis, s21s)
+        self._show_traces(self._plotVswrIn, axis, vswr_in)
+        self._show_traces(self._plotVswrOut, axis, vswr_out)
+        self._show_traces(self._plotS21PhaseErr, axis, phase_errs)
         self._plotS21PhaseErr.axhline(0, 0, 1, linewidth=0.8, color='0.3', linestyle='-')
 
         for xs, ys in zip(itertools.repeat(volts, len(phase_v)), phase_v):
@@ -166,14 +199,151 @@ class PrimaryPlotWidget(QWidget):
         # for xs, ys in zip([freqs] * len(misc), misc):
         #     self._plotMisc.plot(xs, ys)
 
-    def save(self, img_path='./image'):
-        try:
-            os.makedirs(img_path)
-        except OSError as ex:
-            if ex.errno != errno.EEXIST:
-                raise IOError('Error creating image dir.')
+    def begin_stream(self, dev_id=0):
+        self._streamShown = 0
+        self._streamCount = 0
+        if not any(self._streamLines.values()):
+            self.clear()
+            self._init(dev_id)
+        for plot, _, _ in self._streams:
+            for line in self._streamLines[plot]:
+                line.set_visible(False)
+        for trace in self._traces.values():
+            trace.set_visible(False)
+        # backgrounds of the previous run hold its traces
+        self._disconnect_draw()
+        for plot, _, _ in self._streams:
+            ax = plot_axes(plot)
+            # a toolbar zoom or pan turns autoscale off, the new run starts from its own data
+            ax.set_autoscale_on(True)
+            ax.relim(visible_only=True)
+            ax.autoscale_view()
+            self._drawCids[plot] = ax.figure.canvas.mpl_connect(
+                'draw_event', lambda event, p=plot: self._grab_background(p))
+        self._plotS21PhaseRmse.clear()
+        setup_plot(self._plotS21PhaseRmse, self.params[dev_id]['02'])
+        self._streamTimer.start(self.stream_interval)
+
+    @pyqtSlot(int)
+    def on_stateMeasured(self, index):
+        # called for every state, drawing is left to the throttled timer
+        self._streamCount = max(self._streamCount, index + 1)
+
+    def finish_stream(self, dev_id=0):
+        self._streamTimer.stop()
+        if self._result.adjust:
+            self._disconnect_draw()
+            self.plot(dev_id)
+            return
+
+        self._flush_stream()
+        self._disconnect_draw()
+        if self._streamZero is None:
+            self._streamZero = self._plotS21PhaseErr.axhline(0, 0, 1, linewidth=0.8, color='0.3', linestyle='-')
+
+        # the finished result is swapped to the decimated collections for pan and zoom
+        axis = self._result.freq_axis
+        for plot, name, _ in self._streams:
+            for line in self._streamLines[plot]:
+                line.set_visible(False)
+            self._show_traces(plot, axis, getattr(self._result, name))
+
+        phase_v = self._result.phase_v
+        volts = self._result._volts
+        for xs, ys in zip(itertools.repeat(volts, len(phase_v)), phase_v):
+            self._plotS21PhaseRmse.plot(xs, ys)
+        for plot in [plot for plot, _, _ in self._streams] + [self._plotS21PhaseRmse]:
+            plot_axes(plot).figure.canvas.draw_idle()
+
+    def abort_stream(self):
+        self._streamTimer.stop()
+        self._disconnect_draw()
+
+    def _show_traces(self, plot, xs, rows):
+        trace = self._traces.get(plot)
+        if trace is None:
+            self._traces[plot] = TraceCollection(plot_axes(plot), xs, rows)
+            return
+        trace.set_data(xs, rows)
+        trace.set_visible(True)
+
+    def _flush_stream(self):
+        count = self._streamCount
+        if count <= self._streamShown:
+            return
+
+        freqs = self._result.freqs
+        for plot, name, offset in self._streams:
+            rows = getattr(self._result, name)
+            lines = self._streamLines[plot]
+            added = []
+            for state in range(max(self._streamShown, offset), count):
+                i = state - offset
+                if i < len(lines):
+                    line = lines[i]
+                    line.set_data(freqs, rows[i])
+                    line.set_visible(True)
+                else:
+                    line = plot.plot(freqs, rows[i])[0]
+                    lines.append(line)
+                added.append(line)
+            self._redraw(plot, added)
+        self._streamShown = count
+
+    def _redraw(self, plot, lines):
+        if not lines:
+            return
+        ax = lines[0].axes
+        canvas = ax.figure.canvas
+        lo, hi = ax.get_ylim()
+        ymin = min(np.min(line.get_ydata()) for line in lines)
+        ymax = max(np.max(line.get_ydata()) for line in lines)
+
+        if plot not in self._backgrounds or ymin < lo or ymax > hi:
+            ax.relim(visible_only=True)
+            ax.autoscale_view()
+            canvas.draw()
+            return
+
+        canvas.restore_region(self._backgrounds[plot])
+        for line in lines:
+            ax.draw_artist(line)
+        canvas.blit(ax.bbox)
+        self._grab_background(plot)
+
+    def _disconnect_draw(self):
+        for plot, cid in self._drawCids.items():
+            plot_axes(plot).figure.canvas.mpl_disconnect(cid)
+        self._drawCids.clear()
+        self._backgrounds.clear()
+
+    def _grab_background(self, plot):
+        lines = self._streamLines[plot]
+        if lines:
+            ax = lines[0].axes
+            self._backgrounds[plot] = ax.figure.canvas.copy_from_bbox(ax.bbox)
+
+    def snapshot(self, dev_id=0):
+        # copies of the plotted data, the result is reused by the next measurement
+        pars = self.params[dev_id]
+        freqs = np.array(self._result.freqs, dtype=float)
+        volts = np.array(self._result._volts, dtype=float)
 
-        for plot, name in zip([self._plotS21, self._plotVswrIn, self._plotVswrOut, self._plotS21PhaseErr], ['stats.png', 'cutoff.png', 'delta.png', 'double-triple.png']):
-            plot.savefig(img_path + name, dpi=400)
+        def figure(key, xs, rows, hline=None):
+            return {
+                'xlabel': pars[key]['xlabel'],
+                'ylabel': pars[key]['ylabel'],
+                'lines': [(xs, np.array(ys, dtype=float)) for ys in rows],
+                'hline': hline,
+            }
 
+        return [
+            ('stats', figure('00', freqs, self._result.s21)),
+            ('cutoff', figure('01', freqs, self._result.vswr_in)),
+            ('delta', figure('10', freqs, self._result.vswr_out)),
+            ('double-triple', figure('11', freqs, self._result.phase_err, hline=0)),
+            ('phase-v', figure('02', volts, self._result.phase_v)),
+        ]
 
+    def save(self, img_path='./image', formats=default_formats, dev_id=0):
+        return self._exporter.export(self.snapshot(dev_id), img_path, formats)
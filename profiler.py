@@ -0,0 +1,96 @@
+import csv
+import json
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def command_name(command):
+    return command.split(maxsplit=1)[0] if command else command
+
+
+class Profiler:
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def record(self, name, elapsed):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._samples[name].append(elapsed)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    @property
+    def summary(self):
+        with self._lock:
+            samples = {k: np.array(v) for k, v in self._samples.items()}
+        return {
+            name: {
+                'count': len(values),
+                'total': float(values.sum()),
+                'p50': float(np.percentile(values, 50)),
+                'p95': float(np.percentile(values, 95)),
+                'max': float(values.max()),
+            } for name, values in samples.items()
+        }
+
+    def report(self, top=20):
+        rows = sorted(self.summary.items(), key=lambda el: el[1]['total'], reverse=True)[:top]
+        lines = ['Профиль, с (всего / p50 / p95 / кол-во):']
+        lines += [f'{name}: {s["total"]:.3f} / {s["p50"]:.4f} / {s["p95"]:.4f} / {s["count"]}' for name, s in rows]
+        return '\n'.join(lines)
+
+    def export(self, path):
+        summary = self.summary
+        with open(path, mode='wt', encoding='utf-8', newline='') as f:
+            if path.endswith('.csv'):
+                writer = csv.writer(f)
+                writer.writerow(['name', 'count', 'total', 'p50', 'p95', 'max'])
+                for name, s in summary.items():
+                    writer.writerow([name, s['count'], s['total'], s['p50'], s['p95'], s['max']])
+            else:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+class ProfiledInstrument:
+    profiled = ['send', 'query', 'query_raw', 'set_voltage', 'set_current', 'set_output', 'read_voltage']
+
+    def __init__(self, instrument, profiler, name):
+        self._instrument = instrument
+        self._profiler = profiler
+        self._name = name
+
+    def __getattr__(self, item):
+        attr = getattr(self._instrument, item)
+        if item not in self.profiled:
+            return attr
+
+        def wrapped(*args, **kwargs):
+            label = command_name(args[0]) if args and isinstance(args[0], str) else item
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self._profiler.record(f'{self._name} {label}', time.perf_counter() - start)
+        return wrapped
+
+    def __repr__(self):
+        return repr(self._instrument)
@@ -0,0 +1,63 @@
+import errno
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from touchstone import write_s2p
+
+
+def s2p_name(ucontrol):
+    return f's{ucontrol:.01f}'.replace('.', '_') + '.s2p'
+
+
+class S2pArchive:
+    modes = ['off', 'instrument', 'host', 'host_batch']
+
+    def __init__(self, mode='instrument', path='./s2p'):
+        self.mode = mode
+        self.path = path
+        # the mode of the running sweep, changing self.mode takes effect on the next begin()
+        self._mode = 'off'
+        self._writer = None
+        self._pending = list()
+        self._batch = list()
+
+    def begin(self):
+        self._mode = self.mode
+        self._pending.clear()
+        self._batch.clear()
+        if self._mode in ('host', 'host_batch'):
+            try:
+                os.makedirs(self.path)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise IOError('Error creating s2p archive dir.')
+        if self._mode == 'host':
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='s2p-writer')
+
+    def save_remote(self, pna, ucontrol):
+        if self._mode != 'instrument':
+            return
+        pna.send(f'CALC:DATA:SNP:PORTs:Save "1,2", "d:/ksa/psm_analog_s2p/{s2p_name(ucontrol)}"')
+        pna.send(f'MMEM:STOR "d:/ksa/psm_analog_ports2/{s2p_name(ucontrol)}"')
+
+    def save_host(self, ucontrol, pars):
+        if self._mode == 'host':
+            self._pending.append(self._writer.submit(self._write, ucontrol, pars))
+        elif self._mode == 'host_batch':
+            self._batch.append((ucontrol, pars))
+
+    def finish(self):
+        for ucontrol, pars in self._batch:
+            self._write(ucontrol, pars)
+        self._batch.clear()
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        for future in self._pending:
+            future.result()
+        self._pending.clear()
+        self._mode = 'off'
+
+    def _write(self, ucontrol, pars):
+        write_s2p(os.path.join(self.path, s2p_name(ucontrol)), pars, comment=f'U={ucontrol} V')
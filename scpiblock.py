@@ -0,0 +1,26 @@
+import numpy as np
+
+block_dtypes = {
+    'REAL,32': np.dtype('>f4'),
+    'REAL,64': np.dtype('>f8'),
+}
+
+
+def parse_binary_block(raw: bytes, fmt='REAL,64'):
+    if raw[:1] != b'#':
+        raise ValueError('not an IEEE 488.2 block')
+    digits = int(raw[1:2])
+    if not digits:
+        raise ValueError('indefinite length blocks are not supported')
+    length = int(raw[2:2 + digits])
+    start = 2 + digits
+    if len(raw) < start + length:
+        raise ValueError(f'truncated block: expected {length} bytes, got {len(raw) - start}')
+    dtype = block_dtypes[fmt]
+    return np.frombuffer(raw, dtype=dtype, count=length // dtype.itemsize, offset=start)
+
+
+def make_binary_block(values, fmt='REAL,64'):
+    payload = np.asarray(values, dtype=block_dtypes[fmt]).tobytes()
+    length = str(len(payload))
+    return f'#{len(length)}{length}'.encode('ascii') + payload
@@ -0,0 +1,139 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from measureresult import VectorMeasureResult
+
+session_version = 1
+
+# session key -> result field, restored on open
+trace_fields = {
+    'freqs': '_freqs',
+    's11': '_s11s',
+    's21': '_s21s',
+    'phase': '_s21s_ph',
+    's22': '_s22s',
+    'vswr_in': '_vswr_in',
+    'vswr_out': '_vswr_out',
+    'phase_err': '_s21s_ph_err',
+    's21_err': '_s21s_err',
+    'phase_v': '_ph_v',
+}
+
+stat_fields = ['_s21_mins', '_vswr_in_max', '_vswr_out_max', '_phase_err_max', '_s21_err_max',
+               '_s', '_kp_freq_min', '_kp_freq_max', '_kp_bands', '_min_freq_index', '_mid_freq_index',
+               '_max_freq_index']
+
+
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def save_session(path, result, meta=None, compress=False):
+    if not result:
+        raise ValueError('no measurement result to save')
+
+    info = {
+        'version': session_version,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'adjust': result.adjust,
+        'sparse': result.sparse,
+        'adjust_set': result.adjust_set,
+        'volts': list(result._volts),
+        'secondary': dict(result._secondaryParams),
+        'stats': {name: getattr(result, name, 0) for name in stat_fields},
+        **(meta or dict()),
+    }
+
+    arrays = {key: np.asarray(getattr(result, field), dtype=float) for key, field in trace_fields.items()}
+    # adjusted results come from the adjust set, there is no instrument payload to keep
+    arrays['raw'] = np.asarray(getattr(result, 'raw', np.zeros((0, 9, 0))), dtype=float)
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = f'{path}.tmp.npz'
+    savez = np.savez_compressed if compress else np.savez
+    savez(tmp, meta=np.array(json.dumps(info, default=_plain, ensure_ascii=False)), **arrays)
+    os.replace(tmp, path)
+
+
+class Session:
+    # arrays are read from the archive on first access only
+    def __init__(self, path):
+        self.path = path
+        self._file = np.load(path, allow_pickle=False)
+        self.meta = json.loads(str(self._file['meta']))
+        if self.meta.get('version', 0) > session_version:
+            print(f'session {path} was written by a newer version {self.meta["version"]}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getitem__(self, key):
+        return self._file[key]
+
+    def __contains__(self, key):
+        return key in self._file.files
+
+    @property
+    def keys(self):
+        return [k for k in self._file.files if k != 'meta']
+
+    @property
+    def has_raw(self):
+        return 'raw' in self and self['raw'].size > 0
+
+    def close(self):
+        self._file.close()
+
+    def load(self, result=None, reprocess=False):
+        # fills the given result in place, widgets keep a reference to it
+        result = result if result is not None else VectorMeasureResult()
+        volts = self.meta['volts']
+        secondary = self.meta['secondary']
+        result.sparse = self.meta.get('sparse', False)
+
+        if reprocess:
+            if not self.has_raw:
+                raise ValueError(f'session {self.path} has no raw data to reprocess')
+            raw = self['raw']
+            adjust, result.adjust = result.adjust, False
+            try:
+                result.raw_data = raw.shape[2], raw, volts, secondary
+            finally:
+                result.adjust = adjust
+            return result
+
+        result._init()
+        result._volts = list(volts)
+        result._secondaryParams = dict(secondary)
+
+        views = set()
+        if self.has_raw and isinstance(result, VectorMeasureResult):
+            # keep the payload so a reopened session can be saved and reprocessed again
+            raw = self['raw']
+            result._set_raw(raw)
+            result._count = len(raw)
+            result._s21_col_mins = result._s21s.min(axis=0)
+            views = {'freqs', 's11', 's21', 's22'}
+
+        for key, field in trace_fields.items():
+            if key not in views:
+                setattr(result, field, self[key])
+        for name, value in self.meta['stats'].items():
+            setattr(result, name, value)
+        if '_mid_freq_index' not in self.meta['stats']:
+            # sessions written before the middle column was stored
+            result._stat_indexes()
+        result.ready = True
+        return result
@@ -0,0 +1,123 @@
+import time
+
+
+class SettlePolicy:
+    label = 'base'
+    sync_sweep = False
+
+    def __init__(self):
+        self.timings = list()
+
+    def prepare(self, pna, src):
+        self.timings.clear()
+        pna.send('SENS1:SWE:MODE HOLD' if self.sync_sweep else 'SENS1:SWE:MODE CONT')
+
+    def settle(self, pna, src, value):
+        start = time.perf_counter()
+        polls = self._wait(pna, src, value)
+        waited = time.perf_counter() - start
+        if self.sync_sweep:
+            pna.send('SENS1:SWE:MODE SING')
+            pna.query('*OPC?')
+        self.timings.append({
+            'value': value,
+            'settle': waited,
+            'sweep': time.perf_counter() - start - waited,
+            'polls': polls,
+            'release': 0.0,
+        })
+
+    def release(self, pna, src, value):
+        start = time.perf_counter()
+        self._release(pna, src, value)
+        if self.timings:
+            self.timings[-1]['release'] = time.perf_counter() - start
+
+    def _wait(self, pna, src, value):
+        return 0
+
+    def _release(self, pna, src, value):
+        pass
+
+    @property
+    def summary(self):
+        totals = [t['settle'] + t['sweep'] + t['release'] for t in self.timings]
+        if not totals:
+            return {'policy': self.label, 'steps': 0, 'total': 0.0, 'mean': 0.0, 'max': 0.0}
+        return {
+            'policy': self.label,
+            'steps': len(totals),
+            'total': sum(totals),
+            'mean': sum(totals) / len(totals),
+            'max': max(totals),
+        }
+
+
+class FixedSettle(SettlePolicy):
+    label = 'fixed'
+
+    def __init__(self, delay=0.5, post_delay=0.5):
+        super().__init__()
+        self.delay = delay
+        self.post_delay = post_delay
+
+    def _wait(self, pna, src, value):
+        time.sleep(self.delay)
+        return 0
+
+    def _release(self, pna, src, value):
+        time.sleep(self.post_delay)
+
+
+class ReadbackSettle(SettlePolicy):
+    label = 'readback'
+    sync_sweep = True
+
+    def __init__(self, tolerance=0.005, timeout=2.0, interval=0.01, chan=1, query='MEAS:VOLT? (@{chan})'):
+        super().__init__()
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.interval = interval
+        self.chan = chan
+        self.query = query
+
+    def _wait(self, pna, src, value):
+        deadline = time.perf_counter() + self.timeout
+        polls = 0
+        while True:
+            polls += 1
+            reading = self._read(src)
+            if reading is not None and abs(reading - value) <= self.tolerance:
+                return polls
+            if time.perf_counter() > deadline:
+                print(f'source did not settle at {value} V in {self.timeout} s, last reading {reading}')
+                return polls
+            time.sleep(self.interval)
+
+    def _read(self, src):
+        # a garbled or empty reply counts as not settled yet
+        if hasattr(src, 'read_voltage'):
+            reply = src.read_voltage(chan=self.chan)
+        else:
+            reply = src.query(self.query.format(chan=self.chan))
+        try:
+            return float(reply)
+        except (TypeError, ValueError):
+            return None
+
+
+class SweepSettle(SettlePolicy):
+    label = 'sweep'
+    sync_sweep = True
+
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+
+    def _wait(self, pna, src, value):
+        if self.delay:
+            time.sleep(self.delay)
+        return 0
+
+
+settle_policies = [FixedSettle, ReadbackSettle, SweepSettle]
@@ -15,7 +15,7 @@ class StatWidget(QWidget):
 
     @property
     def stats(self):
-        return self._ui.texteditStat.plainText()
+        return self._ui.texteditStat.toPlainText()
 
     @stats.setter
     def stats(self, text):
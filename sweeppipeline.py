@@ -0,0 +1,59 @@
+import queue
+import threading
+
+
+class SweepPipeline:
+
+    def __init__(self, process, depth=4):
+        self._process = process
+        self._depth = depth
+        self._queue = queue.Queue(maxsize=depth)
+        self._thread = None
+        self._error = None
+        self.processed = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.join(reraise=exc_type is None)
+
+    def start(self):
+        if self._depth <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='sweep-processing', daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        if self._thread is None:
+            self._process(item)
+            self.processed += 1
+            return
+        if self._error is not None:
+            raise self._error
+        # blocks while the processing stage is `depth` states behind
+        self._queue.put(item)
+
+    def join(self, reraise=True):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if reraise and self._error is not None:
+            raise self._error
+        return self.processed
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                # the processed state lives in the result, nothing is kept here
+                self._process(item)
+                self.processed += 1
+            except Exception as ex:
+                self._error = ex
@@ -0,0 +1,50 @@
+import math
+
+sweep_modes = ['linear', 'segmented', 'fastcheck']
+
+
+def _points(start, stop, step):
+    return max(int(math.floor(round((stop - start) / step, 9))) + 1, 1)
+
+
+def linear_plan(f1, f2, points):
+    return [(f1, f2, points)]
+
+
+def segmented_plan(f1, f2, centers, span=0.25, dense_step=0.01, sparse_step=0.25):
+    windows = []
+    for c in sorted(centers):
+        lo, hi = max(f1, c - span), min(f2, c + span)
+        if windows and lo <= windows[-1][1] + dense_step:
+            windows[-1][1] = max(windows[-1][1], hi)
+        else:
+            windows.append([lo, hi])
+
+    plan = []
+    cursor = f1
+    for lo, hi in windows:
+        if lo - cursor >= sparse_step:
+            start = cursor if not plan else cursor + sparse_step
+            stop = lo - sparse_step
+            if stop >= start:
+                plan.append((start, stop, _points(start, stop, sparse_step)))
+        points = _points(lo, hi, dense_step)
+        plan.append((lo, lo + (points - 1) * dense_step, points))
+        cursor = plan[-1][1]
+    if f2 - cursor >= sparse_step:
+        start = cursor + sparse_step if plan else cursor
+        plan.append((start, f2, _points(start, f2, sparse_step)))
+    return [(round(a, 6), round(b, 6), n) for a, b, n in plan]
+
+
+def fastcheck_plan(freqs):
+    return [(f, f, 1) for f in sorted(set(round(f, 6) for f in freqs))]
+
+
+def plan_points(plan):
+    return sum(n for _, _, n in plan)
+
+
+def stat_freqs(params):
+    f1, f2 = params['Fborder1'], params['Fborder2']
+    return [f1, (f1 + f2) / 2, f2]
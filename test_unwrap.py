@@ -0,0 +1,63 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from measureresult import unwrap, unwrap_states
+
+sample_dir = 'ref/sample_data'
+
+
+def unwrap_quadratic(xw):
+    # the original O(n^2) implementation, kept as the reference
+    dist = 180
+    xu = list(xw)
+    for i in range(1, len(xw)):
+        diff = xw[i] - xw[i - 1]
+        if diff > dist:
+            for j in range(i, len(xu)):
+                xu[j] -= 2 * dist
+        elif diff < -dist:
+            for j in range(i, len(xu)):
+                xu[j] += 2 * dist
+    return xu
+
+
+def sample_phases():
+    files = sorted(glob.glob(os.path.join(sample_dir, '*.s2p')))
+    if not files:
+        pytest.skip(f'no mock sample data in {sample_dir}')
+    phases = []
+    for file in files:
+        # one line SNP payload as replayed by MockAnalyzer, row 4 is the S21 phase
+        with open(file, mode='rt', encoding='utf-8') as f:
+            phases.append(np.array(f.readline().strip().split(','), dtype=float).reshape(9, -1)[4])
+    return phases
+
+
+def synthetic_phases():
+    rng = np.random.default_rng(0)
+    freqs = np.linspace(0, 1, 1601)
+    slopes = rng.uniform(-3000, 3000, 20)
+    wrapped = (slopes[:, None] * freqs + rng.normal(0, 2, (20, len(freqs))) + 180) % 360 - 180
+    return list(wrapped)
+
+
+@pytest.mark.parametrize('phases', [synthetic_phases, sample_phases])
+def test_unwrap_matches_quadratic(phases):
+    for row in phases():
+        assert np.allclose(unwrap(list(row)), unwrap_quadratic(list(row)), rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('phases', [synthetic_phases, sample_phases])
+def test_unwrap_states_matches_quadratic(phases):
+    rows = np.array(phases())
+    expected = np.array([unwrap_quadratic(list(row)) for row in rows])
+    assert np.allclose(unwrap_states(rows), expected, rtol=0, atol=1e-9)
+
+
+def test_unwrap_edge_cases():
+    assert unwrap([]) == []
+    assert unwrap([10.0]) == [10.0]
+    assert unwrap_states(np.zeros((3, 0))).shape == (3, 0)
@@ -0,0 +1,94 @@
+import datetime
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+freq_units = {
+    'HZ': 1,
+    'KHZ': 1_000,
+    'MHZ': 1_000_000,
+    'GHZ': 1_000_000_000,
+}
+
+
+def parse_options(line):
+    # Touchstone defaults: GHz S MA R 50
+    unit, fmt = freq_units['GHZ'], 'MA'
+    tokens = line.lstrip('#').upper().split()
+    for token in tokens:
+        if token in freq_units:
+            unit = freq_units[token]
+        elif token in ('DB', 'MA', 'RI'):
+            fmt = token
+    return unit, fmt
+
+
+def parse_s2p(text):
+    unit, fmt = parse_options('#')
+    body = []
+    for line in text.splitlines():
+        line = line.split('!', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            unit, fmt = parse_options(line)
+            continue
+        body.append(line)
+
+    values = np.array(' '.join(body).split(), dtype=float).reshape(-1, 9)
+    freqs = values[:, 0] * unit
+    a = values[:, 1::2]
+    b = values[:, 2::2]
+    if fmt == 'DB':
+        return freqs, a, b
+    if fmt == 'MA':
+        with np.errstate(divide='ignore'):
+            return freqs, 20 * np.log10(a), b
+    s = a + 1j * b
+    with np.errstate(divide='ignore'):
+        return freqs, 20 * np.log10(np.abs(s)), np.degrees(np.angle(s))
+
+
+def read_s2p(path):
+    with open(path, mode='rt', encoding='utf-8') as f:
+        return parse_s2p(f.read())
+
+
+def volt_from_name(name):
+    return float(os.path.splitext(name)[0].replace('_', '.'))
+
+
+def list_s2p_dir(path, key=volt_from_name):
+    files = [f for f in os.listdir(path) if f.endswith('.s2p') and os.path.isfile(os.path.join(path, f))]
+    return sorted(((key(f), os.path.join(path, f)) for f in files), key=lambda el: el[0])
+
+
+def load_s2p_dir(path, workers=None, key=volt_from_name, min_parallel=16):
+    files = list_s2p_dir(path, key=key)
+    if not files:
+        raise IOError(f'no .s2p files in {path}')
+    volts = [volt for volt, _ in files]
+    paths = [file for _, file in files]
+
+    if workers == 0 or len(paths) < min_parallel:
+        parsed = [read_s2p(p) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(read_s2p, paths, chunksize=max(1, len(paths) // 32)))
+
+    freqs = parsed[0][0]
+    # states x points x (S11, S21, S12, S22)
+    mags = np.stack([p[1] for p in parsed])
+    phases = np.stack([p[2] for p in parsed])
+    return volts, freqs, mags, phases
+
+
+def write_s2p(path, pars, comment=''):
+    data = np.asarray(pars, dtype=float).reshape(9, -1).T
+    with open(path, mode='wt', encoding='utf-8') as f:
+        f.write(f'! {comment}\n' if comment else '')
+        f.write(f'! {datetime.datetime.now().isoformat(timespec="seconds")}\n')
+        f.write('# Hz S DB R 50\n')
+        np.savetxt(f, data, fmt='%.9g', delimiter=' ')
@@ -0,0 +1,83 @@
+import itertools
+
+import numpy as np
+
+from matplotlib import rcParams
+from matplotlib.collections import LineCollection
+
+from freqaxis import FreqAxis
+
+
+def minmax_decimate(xs, rows, size):
+    # keeps the min and the max of every `size` points in their original order, the trace envelope is exact
+    points = len(xs)
+    count = -(-points // size)
+    padded = np.pad(rows, ((0, 0), (0, count * size - points)), mode='edge').reshape(len(rows), count, size)
+    lo = padded.argmin(axis=2)
+    hi = padded.argmax(axis=2)
+    starts = np.arange(count) * size
+
+    index = np.empty((len(rows), 2 * count), dtype=int)
+    index[:, 0::2] = np.minimum(lo, hi) + starts
+    index[:, 1::2] = np.maximum(lo, hi) + starts
+    np.minimum(index, points - 1, out=index)
+    return xs[index], np.take_along_axis(rows, index, axis=1)
+
+
+class TraceCollection:
+    # all traces of a plot as one LineCollection, decimated to a fraction of the axes pixel width
+    def __init__(self, ax, xs, rows, pixels_per_bucket=4):
+        self.ax = ax
+        self.pixels_per_bucket = pixels_per_bucket
+        self._axis = FreqAxis([])
+        self._xs = np.zeros(0)
+        self._rows = np.zeros((0, 0))
+        # bucket size -> whole trace decimation, panning at the same zoom level only slices it
+        self._levels = dict()
+        self._collection = LineCollection([], linewidths=rcParams['lines.linewidth'])
+        ax.add_collection(self._collection, autolim=False)
+        self._xlim_cid = ax.callbacks.connect('xlim_changed', lambda _: self.update())
+        self._resize_cid = ax.figure.canvas.mpl_connect('resize_event', lambda _: self.update())
+        self.set_data(xs, rows)
+
+    def set_data(self, xs, rows):
+        # xs is a shared FreqAxis or a plain array of x values
+        self._axis = xs if isinstance(xs, FreqAxis) else FreqAxis(xs)
+        self._xs = self._axis.freqs
+        self._rows = np.asarray(rows, dtype=float).reshape(-1, len(self._xs))
+        self._levels.clear()
+
+        colors = rcParams['axes.prop_cycle'].by_key()['color']
+        self._collection.set_color(list(itertools.islice(itertools.cycle(colors), len(self._rows))))
+
+        if self._rows.size:
+            self.ax.update_datalim([(self._xs.min(), self._rows.min()), (self._xs.max(), self._rows.max())])
+            self.ax.autoscale_view()
+        self.update()
+
+    def update(self):
+        if not self._rows.size:
+            self._collection.set_segments([])
+            return
+
+        # one point past each edge so the traces reach the axes borders
+        i0, i1 = self._axis.span(*sorted(self.ax.get_xlim()))
+        buckets = max(int(self.ax.bbox.width) // self.pixels_per_bucket, 1)
+        # bucket sizes are powers of two so zooming reuses a handful of cached levels
+        size = 1 << max(int(np.ceil(np.log2(max(i1 - i0, 1) / buckets))), 0)
+        if size <= 2:
+            xs, ys = np.broadcast_to(self._xs[i0:i1], (len(self._rows), i1 - i0)), self._rows[:, i0:i1]
+        else:
+            level = self._levels.get(size)
+            if level is None:
+                level = self._levels[size] = minmax_decimate(self._xs, self._rows, size)
+            xs, ys = (arr[:, 2 * (i0 // size):2 * -(-i1 // size)] for arr in level)
+        self._collection.set_segments(np.stack([xs, ys], axis=-1))
+
+    def set_visible(self, visible):
+        self._collection.set_visible(visible)
+
+    def remove(self):
+        self.ax.callbacks.disconnect(self._xlim_cid)
+        self.ax.figure.canvas.mpl_disconnect(self._resize_cid)
+        self._collection.remove()